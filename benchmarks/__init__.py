@@ -0,0 +1,7 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Benchmarks, run from the project root as ``python -m benchmarks.<name>``.
+"""
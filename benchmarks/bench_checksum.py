@@ -0,0 +1,70 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Dongle information frame parsing on multi-kilobyte buffers.
+
+    python -m benchmarks.bench_checksum --sizes 1024 4096 16384
+"""
+
+import argparse
+import random
+import timeit
+
+from ble_assistant.config import settings
+from ble_assistant.parser import ble_dongle_info_parser
+from ble_assistant.utils import check_sum, sum_to_check_sum
+
+CHECKSUM_SIZE = settings.CHECKSUM_SIZE
+
+
+def legacy_dongle_info_end(data: bytes):
+    """Checksum search as it was: re-sum the prefix for every index."""
+    st = settings.FRAME_MIN_SIZE - 1
+    for i in range(st, len(data)):
+        checksum = data[i: i + CHECKSUM_SIZE]
+        if checksum == check_sum(data[:i], CHECKSUM_SIZE):
+            return i
+    return -1
+
+
+def make_dongle_info(size: int, seed: int = 0) -> bytes:
+    """
+    Build a dongle information frame of ``size`` bytes whose checksum
+    only matches at the very end, the worst case for the search.
+    """
+    rand = random.Random(seed)
+    data = bytearray(b'\xbb\x00\x00')
+    total = sum(data)
+    while len(data) < size - CHECKSUM_SIZE:
+        byte = rand.randrange(256)
+        if bytes([byte]) == sum_to_check_sum(total):
+            continue
+        data.append(byte)
+        total += byte
+    return bytes(data) + check_sum(data, CHECKSUM_SIZE)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1024, 4096, 16384])
+    arg_parser.add_argument('--number', type=int, default=5)
+    args = arg_parser.parse_args()
+    print(f'{"size":>8} {"legacy ms":>12} {"running ms":>12} {"speedup":>8}')
+    for size in args.sizes:
+        data = make_dongle_info(size)
+        frame = ble_dongle_info_parser(data)
+        assert frame and frame.length == len(data)
+        assert legacy_dongle_info_end(data) == len(data) - CHECKSUM_SIZE
+        legacy = timeit.timeit(lambda: legacy_dongle_info_end(data),
+                               number=args.number) / args.number
+        running = timeit.timeit(lambda: ble_dongle_info_parser(data),
+                                number=args.number) / args.number
+        print(f'{size:>8} {legacy * 1000:>12.3f} {running * 1000:>12.3f} '
+              f'{legacy / running:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Receive path throughput, stage by stage.
+
+Every stage runs over synthetic streams (command responses, scan
+reports, Bali logs, a mix, and the mix with corrupted frames and
+garbage) cut into chunks that mostly end mid-frame. For each it
+reports MB/s, frames/s, the peak traced memory and the number of
+memory blocks allocated for what it produced: the frames, log texts
+or, for the protocol stages, the frames queued in the protocol. The
+``legacy`` stage is the receive path before ``FrameDecoder``, kept as
+the reference the decoder is held to.
+
+Each clean stream is first decoded at chunk sizes from 1 byte to the
+whole stream; it must come out as the frames it was made of, with
+nothing discarded and no resync, or the run fails.
+
+    python -m benchmarks.bench_receive --save baseline.json
+    python -m benchmarks.bench_receive --compare baseline.json
+
+``--capture`` adds the received traffic of a recorded capture as a
+stream, cut at its original chunk boundaries. The ``replay`` stage
+plays each stream through ``ReplayTransport`` into a ``BleComm`` as
+fast as possible.
+
+Run it from a scratch directory with ``LOG_STDOUT=false``: BleProtocol
+writes the usual logs. A Bali log description is generated when the
+configured one does not exist.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import platform
+import tempfile
+import tracemalloc
+
+from ble_assistant import parser, comm, replay
+from ble_assistant.capture import RX
+from benchmarks import legacy
+from benchmarks.streams import (make_stream, split_chunks, STREAMS,
+                                ensure_description)
+
+
+def stage_legacy(case):
+    """The line_parser the decoder replaced, as the reference."""
+    remain = b''
+    res = []
+    for chunk in case['chunks']:
+        frames, remain = legacy.line_parser(remain + chunk)
+        res += frames
+    return len(res), res
+
+
+def stage_line_parser(case):
+    remain = b''
+    res = []
+    for chunk in case['chunks']:
+        frames, remain = parser.line_parser(remain + chunk)
+        res += frames
+    return len(res), res
+
+
+def stage_decoder(case):
+    decoder = parser.FrameDecoder()
+    res = []
+    for chunk in case['chunks']:
+        res += decoder.feed(chunk)
+    return len(res), res
+
+
+def stage_frame_parser(case):
+    res = []
+    for frame in case['frames']:
+        frame = parser.frame_parser(frame)
+        if frame:
+            res.append(frame)
+    return len(res), res
+
+
+def stage_parse_log(case):
+    log_parser = parser.get_log_parser()
+    log_parser.memo.clear()
+    res = [log_parser.parse_log(log) for log in case['logs']]
+    return len(res), res
+
+
+def stage_data_received(case):
+    protocol = comm.BleProtocol()
+    protocol.port = 'BENCH'
+    for chunk in case['chunks']:
+        protocol.data_received(chunk)
+    return case['decoded'], protocol
+
+
+def stage_replay(case):
+    def connector(loop, protocol_factory, port):
+        return replay.create_replay_connection(loop, protocol_factory,
+                                               case['records'], speed=0)
+
+    loop = asyncio.new_event_loop()
+    try:
+        ble = comm.BleComm(loop, 'BENCH', connector=connector)
+        loop.run_until_complete(ble.transport.finished)
+        ble.close()
+    finally:
+        loop.close()
+    return case['decoded'], ble.protocol
+
+
+STAGES = {
+    'legacy': stage_legacy,
+    'line_parser': stage_line_parser,
+    'decoder': stage_decoder,
+    'frame_parser': stage_frame_parser,
+    'parse_log': stage_parse_log,
+    'data_received': stage_data_received,
+    'replay': stage_replay,
+}
+
+
+def make_case(kind, size, chunk, seed):
+    data, frames = make_stream(kind, size, seed)
+    return build_case(data, split_chunks(data, chunk, seed), frames)
+
+
+def capture_case(path):
+    chunks = [data for _, direction, data in replay.load_records(path)
+              if direction == RX]
+    decoder = parser.FrameDecoder()
+    frames = [bytes(frame.raw_data)
+              for chunk in chunks for frame in decoder.feed(chunk)]
+    return build_case(b''.join(chunks), chunks, frames)
+
+
+def build_case(data, chunks, frames):
+    case = {
+        'data': data,
+        'chunks': chunks,
+        'records': [(0.0, RX, chunk) for chunk in chunks],
+        'frames': frames,
+        'logs': [frame for frame in frames if frame[:1] == b'\xc7'],
+    }
+    case['decoded'], _ = stage_decoder(case)
+    return case
+
+
+def check_sync(kind, data, frames, sizes=(1, 3, 16, 64, 1024, 0)):
+    """
+    Decode a clean stream at every chunk size in ``sizes``, 0 for the
+    whole stream at once, and check that it comes out as the frames it
+    was made of with no byte discarded.
+
+    :return: the failures, as printable lines.
+    """
+    failures = []
+    lengths = [len(frame) for frame in frames]
+    for size in sizes:
+        size = size or len(data)
+        decoder = parser.FrameDecoder(lazy_log=True)
+        res = []
+        for i in range(0, len(data), size):
+            res += [frame.length for frame in decoder.feed(data[i:i + size])]
+        if res != lengths or decoder.discarded or decoder.resyncs:
+            failures.append(f'{kind}: {size} byte chunks, '
+                            f'{len(res)}/{len(lengths)} frames, '
+                            f'discarded {decoder.discarded}, '
+                            f'resyncs {decoder.resyncs}')
+    return failures
+
+
+def measure(stage, case, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = stage(case)[0]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, count)
+    elapsed, count = best
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    output = stage(case)
+    # counted while what the stage produced is still alive
+    blocks = sys.getallocatedblocks() - blocks
+    del output
+    tracemalloc.start()
+    stage(case)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if stage is stage_parse_log:
+        size = sum(len(log) for log in case['logs'])
+    elif stage is stage_frame_parser:
+        size = sum(len(frame) for frame in case['frames'])
+    else:
+        size = len(case['data'])
+    return {
+        'mb_s': size / elapsed / 1e6 if elapsed else 0.0,
+        'frames_s': count / elapsed if elapsed else 0.0,
+        'frames': count,
+        'peak_kib': peak / 1024,
+        'blocks': blocks,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline, return the regressions."""
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if not base or not base['mb_s']:
+            continue
+        change = res['mb_s'] / base['mb_s'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = ' REGRESSION'
+            regressions.append(key)
+        print(f'{key:<28} {base["mb_s"]:>9.2f} -> {res["mb_s"]:>9.2f} MB/s '
+              f'{change:>+7.1%}{flag}')
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Receive path benchmark')
+    arg_parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                            default=list(STAGES))
+    arg_parser.add_argument('--streams', nargs='+',
+                            choices=list(STREAMS) + ['noisy'],
+                            default=list(STREAMS) + ['noisy'])
+    arg_parser.add_argument('--size', type=int, default=256 * 1024,
+                            help='bytes per stream')
+    arg_parser.add_argument('--chunk', type=int, default=64,
+                            help='average chunk size')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--capture', action='append', default=[],
+                            help='also run the rx traffic of this capture')
+    arg_parser.add_argument('--save', help='write results to this file')
+    arg_parser.add_argument('--compare', help='baseline file to compare to')
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+                            help='MB/s drop reported as regression')
+    args = arg_parser.parse_args()
+
+    failures = []
+    for kind in args.streams:
+        if kind != 'noisy':
+            failures += check_sync(kind, *make_stream(kind, args.size,
+                                                      args.seed))
+    for failure in failures:
+        print(f'OUT OF SYNC {failure}')
+
+    results = {}
+    print(f'{"stage/stream":<28} {"MB/s":>9} {"frames/s":>11} '
+          f'{"peak KiB":>9} {"blocks":>8}')
+    cases = ((kind, make_case(kind, args.size, args.chunk, args.seed))
+             for kind in args.streams)
+    captures = ((os.path.basename(path), capture_case(path))
+                for path in args.capture)
+    for kind, case in itertools.chain(cases, captures):
+        for name in args.stages:
+            if name == 'parse_log' and not case['logs']:
+                continue
+            res = measure(STAGES[name], case, args.repeat)
+            key = f'{name}/{kind}'
+            results[key] = res
+            print(f'{key:<28} {res["mb_s"]:>9.2f} {res["frames_s"]:>11.0f} '
+                  f'{res["peak_kib"]:>9.1f} {res["blocks"]:>8}')
+
+    if args.save:
+        with open(args.save, 'wt', encoding='utf8') as f:
+            json.dump({'python': sys.version,
+                       'platform': platform.platform(),
+                       'args': vars(args),
+                       'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf8') as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ensure_description(tempfile.mkdtemp())
+    main()
@@ -0,0 +1,116 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Downlink throughput with and without write coalescing.
+
+Bursts of small downlink frames are written through ``BleComm`` to a
+pty simulator, which counts the frames it decodes. For each mode it
+reports frames/s until the simulator has seen every frame, and the
+number of serial writes issued. Single frames are then written one at
+a time, each once the previous one was seen, and the mean time until
+the simulator sees one is reported: coalescing must not delay them.
+
+    python -m benchmarks.bench_write --frames 20000 --burst 32
+
+Run it from a scratch directory with ``LOG_STDOUT=false``: BleComm
+writes the usual logs. Linux only.
+"""
+
+import time
+import asyncio
+import argparse
+
+from ble_assistant.config import settings
+from ble_assistant.comm import BleComm
+from ble_assistant.parser import codec
+from ble_assistant.simulator import DongleSimulator
+
+HEADER = settings.HEADER_DOWNLINK + b'\x01\x02'
+
+
+async def write_frames(ble, frames, burst):
+    for i in range(0, len(frames), burst):
+        for frame in frames[i:i + burst]:
+            await ble.write(frame)
+        # let the loop run between bursts, like a test case awaiting
+        await asyncio.sleep(0)
+    ble.protocol.flush_write()
+
+
+def run(coalesce, frames, burst, timeout=60.0):
+    with DongleSimulator([]) as simulator:
+        loop = asyncio.new_event_loop()
+        try:
+            ble = BleComm(loop, simulator.port, baudrate=settings.BAUDRATE)
+            ble.protocol.coalesce = coalesce
+            start = time.perf_counter()
+            loop.run_until_complete(write_frames(ble, frames, burst))
+            end = time.monotonic() + timeout
+            while simulator.stats['requests'] < len(frames):
+                if time.monotonic() > end:
+                    break
+                loop.run_until_complete(asyncio.sleep(0.001))
+            elapsed = time.perf_counter() - start
+            writes = ble.protocol.metrics.tx_writes
+            ble.close()
+            loop.run_until_complete(asyncio.sleep(0))
+        finally:
+            loop.close()
+        received = simulator.stats['requests']
+    return {
+        'frames_s': received / elapsed if elapsed else 0.0,
+        'received': received,
+        'writes': writes,
+    }
+
+
+def single_latency(coalesce, frame, count, timeout=5.0):
+    """Mean seconds until the simulator sees a frame written alone."""
+    with DongleSimulator([]) as simulator:
+        loop = asyncio.new_event_loop()
+        try:
+            ble = BleComm(loop, simulator.port, baudrate=settings.BAUDRATE)
+            ble.protocol.coalesce = coalesce
+            total = 0.0
+            for i in range(count):
+                start = time.perf_counter()
+                loop.run_until_complete(ble.write(frame))
+                end = time.monotonic() + timeout
+                while simulator.stats['requests'] <= i:
+                    if time.monotonic() > end:
+                        break
+                    loop.run_until_complete(asyncio.sleep(0.0001))
+                total += time.perf_counter() - start
+            ble.close()
+            loop.run_until_complete(asyncio.sleep(0))
+        finally:
+            loop.close()
+    return total / count if count else 0.0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Write coalescing benchmark')
+    arg_parser.add_argument('--frames', type=int, default=20000)
+    arg_parser.add_argument('--burst', type=int, default=32,
+                            help='frames written between loop iterations')
+    arg_parser.add_argument('--payload', type=int, default=8,
+                            help='payload bytes per frame')
+    arg_parser.add_argument('--singles', type=int, default=200,
+                            help='frames written one at a time')
+    args = arg_parser.parse_args()
+
+    frame = codec.encode(HEADER, bytes(args.payload))
+    frames = [frame] * args.frames
+    print(f'{"mode":<10} {"frames/s":>11} {"received":>9} {"writes":>8} '
+          f'{"single ms":>10}')
+    for name, coalesce in (('direct', False), ('coalesce', True)):
+        res = run(coalesce, frames, args.burst)
+        latency = single_latency(coalesce, frame, args.singles)
+        print(f'{name:<10} {res["frames_s"]:>11.0f} {res["received"]:>9} '
+              f'{res["writes"]:>8} {latency * 1000:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+The receive path as it was before ``FrameDecoder``, kept verbatim as
+the reference for the benchmarks. Only the Bali log text comes from
+the current ``LogParser``.
+"""
+
+from ble_assistant.blenamedtuple import FrameTuple
+from ble_assistant.utils import check_sum
+from ble_assistant.config import settings
+from ble_assistant import parser
+
+LOG_HEADERS = [settings.HEADER_LOG, settings.HEADER_BALI_LOG]
+HEADERS = [settings.HEADER_DOWNLINK] + LOG_HEADERS + settings.HEADER_UPLINK
+
+BYTE_ORDER = settings.BYTE_ORDER
+HEADER_SIZE = settings.HEADER_SIZE
+PROTOCOL_SIZE = settings.PROTOCOL_SIZE
+DATA_LEN_INDEX = settings.DATA_LEN_INDEX
+PAYLOAD_INDEX = settings.PAYLOAD_INDEX
+CHECKSUM_SIZE = settings.CHECKSUM_SIZE
+FRAME_MIN_SIZE = settings.FRAME_MIN_SIZE
+
+
+def parser_raw_data(data):
+    header = settings.HEADER_BALI_LOG
+    if data[1] == 0xd8:
+        raw_data = data[:5]
+        data_len = 4
+    elif data[1] == 0xd9:
+        data_len = data[4]
+        raw_data = data[:(4 + data_len + 2)]
+    else:
+        return b''
+    payload = parser.get_log_parser().parse_log(raw_data)
+    frame = FrameTuple(header=header,
+                       data_len=data_len,
+                       payload=payload,
+                       checksum=b'',
+                       length=len(raw_data),
+                       raw_data=raw_data)
+    return frame
+
+
+def is_ble_dongle_info(header: bytes) -> bool:
+    if settings.DEVICE != 'ble':
+        return False
+    return header == b'\xbb\x00\x00'
+
+
+def ble_dongle_info_parser(data: bytes):
+    st = settings.FRAME_MIN_SIZE - 1
+    for i in range(st, len(data)):
+        checksum = data[i: i + CHECKSUM_SIZE]
+        if checksum == check_sum(data[:i], CHECKSUM_SIZE):
+            protocol = data[: PROTOCOL_SIZE]
+            data_len = len(data) - PROTOCOL_SIZE - CHECKSUM_SIZE
+            payload = data[PROTOCOL_SIZE: -CHECKSUM_SIZE]
+            frame = FrameTuple(header=protocol,
+                               data_len=data_len,
+                               payload=payload,
+                               checksum=checksum,
+                               length=i + 1,
+                               raw_data=data[:i+1])
+            return frame
+    return b''
+
+
+def frame_parser(data: bytes):
+    if data[:HEADER_SIZE] == settings.HEADER_BALI_LOG:
+        return parser_raw_data(data)
+    if len(data) < settings.FRAME_MIN_SIZE:
+        return b''
+    protocol = data[: PROTOCOL_SIZE]
+    if is_ble_dongle_info(protocol):
+        return ble_dongle_info_parser(data)
+    data_len = int.from_bytes(data[DATA_LEN_INDEX: PAYLOAD_INDEX],
+                              byteorder=BYTE_ORDER)
+    check_sum_index = data_len + PAYLOAD_INDEX
+    if check_sum_index >= len(data):
+        return b''
+    end = check_sum_index + CHECKSUM_SIZE
+    checksum = data[check_sum_index: end]
+    line = data[:check_sum_index]
+    if checksum == check_sum(line, CHECKSUM_SIZE):
+        payload = data[PAYLOAD_INDEX: PAYLOAD_INDEX + data_len]
+        frame = FrameTuple(header=protocol,
+                           data_len=data_len,
+                           payload=payload,
+                           checksum=checksum,
+                           length=len(line),
+                           raw_data=line)
+        return frame
+    return b''
+
+
+def line_parser(data: bytes):
+    cursor = 0
+    end = len(data)
+    res = []
+    remain = data
+    while cursor < end:
+        if cursor + FRAME_MIN_SIZE > end:
+            break
+        if data[cursor: cursor+HEADER_SIZE] in HEADERS:
+            frame = frame_parser(data[cursor:])
+            if frame:
+                cursor = frame.length + cursor
+                remain = data[cursor:]
+                res.append(frame)
+                continue
+        cursor = cursor + 1
+    return res, remain
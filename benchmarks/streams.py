@@ -0,0 +1,132 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Synthetic serial streams for the benchmarks.
+"""
+
+import os
+import random
+
+from ble_assistant.config import settings
+from ble_assistant.parser import make_frame
+
+SCAN_HEADER = b'\xdd\x01\x02'
+# log types/infos used by bali_log() and described by write_description()
+BALI_TYPES = {1: 'SYS', 2: 'LL', 3: 'HCI'}
+BALI_INFOS = range(1, 33)
+
+
+def command_response(rand):
+    model = rand.randrange(1, 16)
+    opcode = rand.randrange(256)
+    payload = bytes(rand.randrange(256) for _ in range(rand.randrange(2, 21)))
+    return make_frame(bytes([0xbb, model, opcode]), payload)
+
+
+def scan_report(rand):
+    # address, address type, rssi and a full advertising payload
+    payload = bytes(rand.randrange(256) for _ in range(rand.randrange(36, 41)))
+    return make_frame(SCAN_HEADER, payload)
+
+
+def bali_log(rand):
+    code = rand.choice(list(BALI_TYPES)) << 10 | rand.choice(BALI_INFOS)
+    if rand.random() < 0.3:
+        return bytes([0xc7, 0xd8, code >> 8, code & 0xff, 0])
+    value = bytes(rand.randrange(256) for _ in range(2))
+    return bytes([0xc7, 0xd9, code >> 8, code & 0xff, 2]) + value + b'\x00'
+
+
+def text_log(rand):
+    text = f'tick {rand.randrange(100000)} heap {rand.randrange(4096)}\r\n'
+    return make_frame(settings.HEADER_LOG + b'\x00\x00', text.encode())
+
+
+def corrupt(rand, frame: bytes) -> bytes:
+    frame = bytearray(frame)
+    frame[rand.randrange(len(frame))] ^= 1 << rand.randrange(8)
+    return bytes(frame)
+
+
+STREAMS = {
+    'response': [(command_response, 1)],
+    'scan': [(scan_report, 9), (command_response, 1)],
+    'bali': [(bali_log, 9), (command_response, 1)],
+    'mixed': [(scan_report, 5), (bali_log, 2), (text_log, 1),
+              (command_response, 2)],
+}
+
+
+def make_stream(kind: str, size: int, seed: int = 0):
+    """
+    Build about ``size`` bytes of traffic.
+
+    ``kind`` is one of ``STREAMS`` or ``noisy``, which is ``mixed`` with
+    corrupted frames and runs of garbage in between.
+
+    :return: the stream and the list of frames it was made of.
+    """
+    rand = random.Random(seed)
+    noisy = kind == 'noisy'
+    makers, weights = zip(*STREAMS['mixed' if noisy else kind])
+    frames = []
+    data = bytearray()
+    while len(data) < size:
+        frame = rand.choices(makers, weights)[0](rand)
+        if noisy and rand.random() < 0.05:
+            frame = corrupt(rand, frame)
+        if noisy and rand.random() < 0.05:
+            data += bytes(rand.randrange(256)
+                          for _ in range(rand.randrange(1, 64)))
+        frames.append(frame)
+        data += frame
+    return bytes(data), frames
+
+
+def split_chunks(data: bytes, average: int, seed: int = 0):
+    """Cut ``data`` into chunks of random size, mostly mid-frame."""
+    rand = random.Random(seed)
+    chunks = []
+    i = 0
+    while i < len(data):
+        n = rand.randrange(1, 2 * average)
+        chunks.append(data[i: i + n])
+        i += n
+    return chunks
+
+
+def write_description(path: str) -> str:
+    """Write a Bali log description covering ``bali_log()``."""
+    lines = ['<root>', '  <auto>']
+    for value, name in BALI_TYPES.items():
+        lines.append(f'    <log_type key="{name}" value="{value}"/>')
+    lines += ['  </auto>', '  <infos>']
+    for name in BALI_TYPES.values():
+        items = ''.join(f'<item key="{name}_EVT{i}" value="{i}"/>'
+                        for i in BALI_INFOS)
+        lines.append(f'    <log_info name="{name}">{items}</log_info>')
+    lines += ['  </infos>', '  <paras>']
+    for name in BALI_TYPES.values():
+        for i in BALI_INFOS:
+            attrs = f'log_type="{name}" log_info="{name}_EVT{i}"'
+            if i % 2:
+                items = ''.join(f'<item key="S{v}" value="{v}"/>'
+                                for v in range(8))
+                field = f'<filed type="RAW_VALUE_TYPE_ENUM16">{items}</filed>'
+            else:
+                field = '<filed type="RAW_VALUE_TYPE_U16"/>'
+            lines.append(f'    <para {attrs} description="value:">'
+                         f'{field}</para>')
+    lines += ['  </paras>', '</root>']
+    filename = os.path.join(path, 'ble_uplink_desc.xml')
+    with open(filename, 'wt', encoding='utf8') as f:
+        f.write('\n'.join(lines))
+    return filename
+
+
+def ensure_description(path: str):
+    """Use a generated description when the configured one is missing."""
+    if not os.path.exists(settings.BALI_LOG_DESCRIPT):
+        settings.BALI_LOG_DESCRIPT = write_description(path)
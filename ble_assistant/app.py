@@ -5,20 +5,20 @@ All rights reserved.
 """
 
 import os
+import json
 import time
 import asyncio
 import inspect
 
-import serial
-from serial.tools import list_ports
 from openpyxl.styles import Alignment
 
 from . import logger
 from .config import settings
 from . import parser
 from .report import Report, ExcelHandler
-from .device import Device
-from .log import set_file_handler
+from .discovery import discover_dongles
+from .log import set_file_handler, shutdown_logging
+from .capture import close_capture
 from .casemanage import CaseManage
 
 
@@ -57,24 +57,22 @@ class App:
             dongle.close()
         self.dongles = []
 
-    async def get_dongles(self):
-        """"""
+    async def get_dongles(self, ports=None, rescan=False):
+        """
+        Connect the dongles on ``ports``, by default on the COM ports
+        that may be dongles, all probed at once.
+        :param ports: port names, e.g. of simulated dongles
+        :param rescan: probe ports known not to be dongles as well
+        :return:
+        """
         self.disconnect()
         loop = asyncio.get_event_loop()
-        for com_port in list_ports.comports():
-            port = com_port.device
-            try:
-                dongle = Device(loop, port,
-                                baudrate=self.baudrate,
-                                timeout=self.timeout)
-                if dongle.info:
-                    self.dongles.append(dongle)
-                    await dongle.reset()
-                else:
-                    dongle.close()
-            except serial.serialutil.SerialException as exc:
-                print("SerialException: can't configure port {}".format(port))
-                print(str(exc))
+        dongles = await discover_dongles(loop, ports,
+                                         rescan=rescan,
+                                         baudrate=self.baudrate,
+                                         timeout=self.timeout)
+        self.dongles.extend(dongles)
+        await asyncio.gather(*(dongle.reset() for dongle in dongles))
 
     def config_log(self):
         """
@@ -178,14 +176,64 @@ class App:
                     if self.costtime:
                         raw = f"{func.case_info['no']}: {func.case_info['cost_time']}\n"
                         self.costtime.write(raw)
+                    if settings.METRICS_DUMP:
+                        self.dump_metrics(func.case_info['no'])
         finally:
             self.running = False
+            self.report_queues()
             self.report.close()
             self.report.remove_handler(self.excel_handler)
             if self.costtime:
                 self.costtime.close()
                 self.costtime = None
 
+    def metrics(self):
+        """
+        Link metrics of every dongle, keyed by port.
+        :return:
+        """
+        return {dongle.port: dongle.ser.protocol.metrics_snapshot()
+                for dongle in self.dongles}
+
+    def dump_metrics(self, case_no):
+        """
+        Append the link metrics after case ``case_no`` to metrics.jsonl
+        in the log directory of the run.
+        :param case_no:
+        :return:
+        """
+        line = json.dumps({'case': case_no,
+                           'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                           'ports': self.metrics()})
+        with open(os.path.join(self.log_path, 'metrics.jsonl'), 'at',
+                  encoding='utf8') as f:
+            f.write(line + '\n')
+
+    def report_queues(self):
+        """
+        Write the receive queue peaks, drops and throttled time of every
+        dongle to an "rx queue" sheet of the report, apart from the test
+        results, and log them, a warning when frames were dropped.
+        :return:
+        """
+        rows = [['port', 'peak frames', 'peak KiB', 'dropped',
+                 'throttled s', 'policy']]
+        for dongle in self.dongles:
+            stats = dongle.ser.protocol.queue_stats
+            rows.append([dongle.port, stats['peak_depth'],
+                         round(stats['peak_bytes'] / 1024, 1),
+                         stats['dropped'], stats['throttled_s'],
+                         stats['policy']])
+            msg = (f"dropped {stats['dropped']}, peak {stats['peak_depth']} "
+                   f"frames/{stats['peak_bytes'] / 1024:.1f} KiB, "
+                   f"throttled {stats['throttled_s']} s")
+            if stats['dropped']:
+                logger.warning('[%s]receive queue: %s', dongle.port, msg)
+            else:
+                logger.info('[%s]receive queue: %s', dongle.port, msg)
+        if self.excel_handler is not None:
+            self.excel_handler.write_sheet('rx queue', rows)
+
     def stop(self):
         for task in self.tasks:
             task.cancel()
@@ -202,3 +250,5 @@ class App:
     def close(self):
         self.stop()
         self.report.close()
+        close_capture()
+        shutdown_logging()
@@ -9,3 +9,76 @@ FrameTuple = namedtuple('frame', ['header',
 
 ErrorCodeTuple = namedtuple('error_code', ['code',
                                            'status'])
+
+CaptureRecord = namedtuple('capture_record', ['timestamp',
+                                              'direction',
+                                              'port',
+                                              'data'])
+
+
+class Frame:
+    """
+    Received frame, a set of offsets into a shared buffer.
+
+    ``payload``, ``raw_data`` and ``checksum`` are memoryview slices of
+    that buffer, use ``bytes()`` on them when a copy is needed. The
+    header is kept as bytes since it is used as a dict key. A decoded
+    payload, such as the text of a Bali log, replaces the slice.
+    ``detach`` copies a frame that is kept for long.
+    """
+    __slots__ = ('header', 'data_len', '_buffer', '_start', '_payload',
+                 '_checksum', '_raw_end', '_end', '_decoded')
+
+    def __init__(self, buffer: memoryview, start: int, payload: int,
+                 checksum: int, raw_end: int, end: int,
+                 header: bytes, data_len: int, decoded=None):
+        self.header = header
+        self.data_len = data_len
+        self._buffer = buffer
+        self._start = start
+        # offsets from the start, small ints are not allocated per frame
+        self._payload = payload - start
+        self._checksum = checksum - start
+        self._raw_end = raw_end - start
+        self._end = end - start
+        self._decoded = decoded
+
+    def __repr__(self):
+        return (f'Frame(header={self.header!r}, data_len={self.data_len}, '
+                f'raw_data={self.raw_data.hex()})')
+
+    @property
+    def payload(self):
+        if self._decoded is not None:
+            return self._decoded
+        start = self._start
+        return self._buffer[start + self._payload:start + self._checksum]
+
+    @property
+    def checksum(self) -> memoryview:
+        start = self._start
+        return self._buffer[start + self._checksum:start + self._end]
+
+    @property
+    def raw_data(self) -> memoryview:
+        start = self._start
+        return self._buffer[start:start + self._raw_end]
+
+    @property
+    def length(self) -> int:
+        return self._end
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    def detach(self) -> 'Frame':
+        """
+        Copy of the frame with a buffer of its own, which does not keep
+        the shared one alive.
+        """
+        start = self._start
+        buffer = memoryview(bytes(self._buffer[start:start + self._end]))
+        return Frame(buffer, 0, self._payload, self._checksum,
+                     self._raw_end, self._end, self.header, self.data_len,
+                     self._decoded)
@@ -0,0 +1,226 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Binary capture of the serial traffic.
+
+A capture file starts with a header of magic, wall clock and monotonic
+clock at creation, followed by records of
+
+    timestamp (double, time.monotonic) | direction (u8) | port id (u16)
+    | length (u32) | raw bytes
+
+all little endian. A META record assigns a port name to a port id
+before the first record of that port, so one file holds every port of
+a session. ``wall_time`` maps a record timestamp back to the clock.
+"""
+
+import os
+import mmap
+import time
+import struct
+import atexit
+import threading
+
+from ble_assistant.config import settings
+from ble_assistant.blenamedtuple import CaptureRecord
+
+MAGIC = b'BLECAP\x00\x01'
+FILE_HEADER = struct.Struct('<8sdd')
+RECORD_HEADER = struct.Struct('<dBHI')
+
+RX = 0
+TX = 1
+META = 2
+DIRECTIONS = {RX: 'rx', TX: 'tx', META: 'meta'}
+
+SUFFIX = '.bcap'
+
+
+class CaptureWriter:
+    """
+    Append-only capture file, shared by all ports of a session.
+
+    Records go through a buffered file. A daemon thread flushes it
+    every ``flush_interval`` seconds, so a capture is at most that old
+    when the process dies.
+    """
+
+    def __init__(self, filename: str,
+                 flush_interval: float = 1.0,
+                 buffering: int = 64 * 1024):
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.ports = {}
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = open(filename, 'wb', buffering=buffering)
+        self._file.write(FILE_HEADER.pack(MAGIC, time.time(), time.monotonic()))
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop,
+                                        name='capture-flush', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def _port_id(self, port) -> int:
+        port_id = self.ports.get(port)
+        if port_id is None:
+            port_id = self.ports[port] = len(self.ports)
+            self._write(META, port_id, str(port).encode('utf8'),
+                        time.monotonic())
+        return port_id
+
+    def _write(self, direction, port_id, data, timestamp):
+        self._file.write(RECORD_HEADER.pack(timestamp, direction,
+                                            port_id, len(data)))
+        self._file.write(data)
+        self.records += 1
+
+    def write(self, port, direction: int, data, timestamp: float = None):
+        """
+        Append one chunk of ``port``.
+        :param port: port name
+        :param direction: ``RX`` or ``TX``
+        :param data: raw bytes
+        :param timestamp: ``time.monotonic()`` by default
+        :return:
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            if self.closed:
+                return
+            self._write(direction, self._port_id(port), data, timestamp)
+
+    def flush(self):
+        with self._lock:
+            if not self.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self._closed.set()
+            self._file.close()
+
+
+class CaptureReader:
+    """
+    Iterate the records of a capture file from a memory map.
+
+    The ``data`` of a record is a memoryview into the map, valid until
+    the reader is closed; use ``bytes()`` to keep it longer. A record
+    cut off by a crash ends the iteration.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f'{filename} is not a capture file')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        magic, self.wall_start, self.monotonic_start = \
+            FILE_HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{filename} is not a capture file')
+        self.ports = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.records()
+
+    def wall_time(self, timestamp: float) -> float:
+        """``time.time()`` value of a record timestamp."""
+        return self.wall_start + timestamp - self.monotonic_start
+
+    def records(self, meta: bool = False):
+        """
+        Yield a ``CaptureRecord`` per chunk, with the port name.
+        :param meta: also yield the META records
+        """
+        view = self._view
+        end = len(view)
+        offset = FILE_HEADER.size
+        unpack_from = RECORD_HEADER.unpack_from
+        header_size = RECORD_HEADER.size
+        while offset + header_size <= end:
+            timestamp, direction, port_id, length = unpack_from(view, offset)
+            offset += header_size
+            if offset + length > end:
+                return
+            data = view[offset:offset + length]
+            offset += length
+            if direction == META:
+                self.ports[port_id] = str(data, 'utf8')
+                if not meta:
+                    continue
+            yield CaptureRecord(timestamp, direction,
+                                self.ports.get(port_id, port_id), data)
+
+    def close(self):
+        """
+        Unmap the file. Record data still referenced keeps the map open
+        until it is released.
+        """
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+
+def is_capture_file(filename: str) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+_writer = None
+
+
+def get_capture_writer() -> CaptureWriter:
+    """
+    The capture writer of this session, created in the serial log
+    directory on first use.
+    """
+    global _writer
+    if _writer is None or _writer.closed:
+        path = os.path.join(settings.LOG_PATH, settings.SERIAL_LOG_NAME)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        name = time.strftime('capture-%Y-%m-%d-%H-%M-%S') + SUFFIX
+        _writer = CaptureWriter(os.path.join(path, name),
+                                settings.SERIAL_CAPTURE_FLUSH_INTERVAL)
+    return _writer
+
+
+def close_capture():
+    if _writer is not None:
+        _writer.close()
+
+
+atexit.register(close_capture)
@@ -4,22 +4,28 @@
 All rights reserved.
 """
 
+import os
 import asyncio
 import time
-import queue
 
 import serial_asyncio
 
 from ble_assistant import logger, dongle_logger, serial_logger
-from ble_assistant.parser import (line_parser, is_log_frame,
+from ble_assistant.log import LazyHex, LazyRepr
+from ble_assistant.parser import (FrameDecoder, is_log_frame,
                                   settings)
 from ble_assistant.payload import BasePayload
+from ble_assistant.donglelog import DongleLogRecord, DongleLogBuffer
+from ble_assistant.dispatcher import FrameDispatcher
+from ble_assistant.capture import get_capture_writer, RX, TX
+from ble_assistant.reader import create_threaded_serial_connection
+from ble_assistant.metrics import LinkMetrics
 
 
 def info_scan_data(frame):
     if settings.SCAN_PRINT:
         return True
-    if settings.DEVCE != 'ble':
+    if settings.DEVICE != 'ble':
         return True
     return frame.header != b'\xdd\x01\x02'
 
@@ -28,22 +34,52 @@ class FlowControl:
     def __init__(self, transport):
         self._transport = transport
         self.read_paused = False
+        self.read_throttled = False
         self.write_paused = False
+        self._reading = True
         self._is_writable_event = asyncio.Event()
         self._is_writable_event.set()
+        self._read_paused_at = None
+        self._read_paused_total = 0.0
 
     async def drain(self):
         await self._is_writable_event.wait()
 
+    def read_paused_time(self) -> float:
+        """Total seconds reading has been paused, including now."""
+        if self._read_paused_at is None:
+            return self._read_paused_total
+        return self._read_paused_total + time.monotonic() - self._read_paused_at
+
+    def _update_reading(self):
+        reading = not (self.read_paused or self.read_throttled)
+        if reading != self._reading:
+            self._reading = reading
+            if reading:
+                self._transport.resume_reading()
+            else:
+                self._transport.pause_reading()
+
     def pause_reading(self):
         if not self.read_paused:
             self.read_paused = True
-            self._transport.pause_reading()
+            self._read_paused_at = time.monotonic()
+            self._update_reading()
 
     def resume_reading(self):
         if self.read_paused:
             self.read_paused = False
-            self._transport.resume_reading()
+            self._read_paused_total = self.read_paused_time()
+            self._read_paused_at = None
+            self._update_reading()
+
+    def throttle_reading(self, on: bool):
+        """
+        Back-pressure from the receive queue. Unlike ``pause_reading``
+        it does not hold off the deadlines of frames being waited for.
+        """
+        self.read_throttled = on
+        self._update_reading()
 
     def pause_writing(self):
         if not self.write_paused:
@@ -59,11 +95,27 @@ class FlowControl:
 class BleProtocol(asyncio.Protocol):
     def __init__(self):
         super().__init__()
-        self.queue = queue.Queue()
-        self.data = b''
-        self.log_text = ''
+        self.dispatcher = FrameDispatcher(
+            settings.MAILBOX_SIZE,
+            max_frames=settings.RX_QUEUE_MAX_FRAMES,
+            max_bytes=settings.RX_QUEUE_MAX_BYTES,
+            policy=settings.RX_QUEUE_POLICY,
+            throttle=self.throttle_reading,
+        )
+        self._reported_dropped = 0
+        self._reported_at = 0.0
+        self.metrics = LinkMetrics()
+        self.dispatcher.wait = self.metrics.wait
+        self.decoder = FrameDecoder(lazy_log=settings.DONGLE_LOG_LAZY)
+        self.log_records = DongleLogBuffer(settings.DONGLE_LOG_MAX_RECORDS,
+                                           settings.DONGLE_LOG_MAX_BYTES)
         self.transport = None
         self.flow = None
+        self.capture = None
+        self.coalesce = settings.WRITE_COALESCE
+        self._tx = []
+        self._tx_size = 0
+        self._tx_handle = None
         self.port = None
         self.name = None
         self.payload = dict()
@@ -74,58 +126,157 @@ class BleProtocol(asyncio.Protocol):
             return f'[{self.port}][{self.name}]'
         return f'[{self.port}]'
 
-    def connection_mode(self, transport):
+    @property
+    def mailbox_stats(self):
+        """Depth and drop count of every header mailbox."""
+        return self.dispatcher.stats()
+
+    @property
+    def queue_stats(self):
+        """Receive queue depth, peaks and drops of this port."""
+        return self.dispatcher.queue_stats()
+
+    def throttle_reading(self, on: bool):
+        if on:
+            logger.warning('%sreceive queue full, pause reading: %s',
+                           self.info, self.queue_stats)
+        if self.flow is not None:
+            self.flow.throttle_reading(on)
+
+    def report_drops(self):
+        """Log frames dropped by the receive queue, at most once a second."""
+        dropped = self.dispatcher.dropped
+        if dropped == self._reported_dropped:
+            return
+        now = time.monotonic()
+        if now - self._reported_at < 1.0:
+            return
+        logger.warning('%sreceive queue dropped %d frames: %s', self.info,
+                       dropped - self._reported_dropped, self.queue_stats)
+        self._reported_dropped = dropped
+        self._reported_at = now
+
+    def metrics_snapshot(self) -> dict:
+        """Link metrics of this port, safe to call from any thread."""
+        decoder = getattr(self.transport, 'decoder', self.decoder)
+        return self.metrics.snapshot(decoder, self.queue_stats)
+
+    @property
+    def link_quality(self):
+        """Receive noise counters of this port."""
+        # a threaded transport cuts frames with its own decoder
+        decoder = getattr(self.transport, 'decoder', self.decoder)
+        return {'discarded': decoder.discarded,
+                'resyncs': decoder.resyncs}
+
+    def connection_made(self, transport):
         self.transport = transport
         self.flow = FlowControl(transport)
+        if settings.SERIAL_CAPTURE_ENABLE:
+            self.capture = get_capture_writer()
+
+    @property
+    def log_text(self):
+        return self.log_records.text()
+
+    def clear_log(self):
+        self.log_records.clear()
 
     def add_payload_to_log(self, frame):
-        if isinstance(frame.payload, str):
-            payload = frame.payload
-        else:
-            try:
-                payload = frame.payload.decode('utf8')
-            except UnicodeDecodeError:
-                payload = str(frame.payload)
-        self.log_text += payload
-        self.log_text = self.log_text[-6000:]
-        dongle_logger.info('%s %s', self.info, payload)
+        record = DongleLogRecord(frame, lazy=settings.DONGLE_LOG_LAZY)
+        self.log_records.append(record)
+        dongle_logger.info('%s %s', self.info, record)
 
     def payload_handle(self, frame):
         item = self.payload.get(frame.header)
         if item:
-            payload = item.uplink_payload(frame.payload)
+            payload = item.uplink_payload(bytes(frame.payload))
             if hasattr(item, 'name'):
                 info = f'{self.info}[{item.name}]'
             else:
                 info = self.info
         else:
-            payload = frame.payload
+            payload = bytes(frame.payload)
             info = self.info
         return info, payload
 
     def data_received(self, data: bytes):
-        serial_logger.info('%s %s', self.info, repr(data))
-        self.data += data
-        frames, remain = line_parser(self.data)
-        self.data = remain
+        start = time.perf_counter()
+        self.raw_received(data)
+        self.frames_received(self.decoder.feed(data))
+        self.metrics.process.add(time.perf_counter() - start)
+
+    def raw_received(self, data: bytes):
+        """Capture or log a received chunk."""
+        self.metrics.received(data)
+        if self.capture is not None:
+            self.capture.write(self.port, RX, data)
+        else:
+            serial_logger.info('%s %s', self.info, LazyRepr(data))
+
+    def frames_received(self, frames):
+        metrics = self.metrics
         for frame in frames:
+            metrics.frame(frame.header)
             if is_log_frame(frame):
                 self.add_payload_to_log(frame)
                 continue
             info, payload = self.payload_handle(frame)
             if info_scan_data(frame):
-                logger.info('%s<<< %s', self.info, frame.raw_data.hex())
+                logger.info('%s<<< %s', self.info, LazyHex(frame.raw_data))
                 if not isinstance(payload, bytes):
                     logger.info('%s<<< %s', info, payload)
-            self.queue.put_nowait((payload, frame))
+            self.dispatcher.dispatch((payload, frame))
+        self.report_drops()
 
     def connection_lost(self, exc):
-        logger.info('%sport closed', self.info)
+        logger.info('%sport closed, %s, %s', self.info,
+                    self.link_quality, self.queue_stats)
+        if self._tx_handle is not None:
+            self._tx_handle.cancel()
+            self._tx_handle = None
+        self._tx.clear()
         if self.flow is not None:
             self.flow.resume_writing()
 
     def data_write(self, data: bytes):
-        logger.info('%s>>> %s', self.info, data.hex())
+        logger.info('%s>>> %s', self.info, LazyHex(data))
+        self.metrics.sent(data)
+        if not self.coalesce:
+            self._transport_write(data)
+            return
+        if self._tx_handle is None:
+            # nothing written lately, no reason to wait: the frames that
+            # follow within the delay are joined
+            self._transport_write(data)
+            loop = asyncio.get_event_loop()
+            self._tx_handle = loop.call_later(settings.WRITE_COALESCE_DELAY,
+                                              self.flush_write)
+            return
+        self._tx.append(data)
+        self._tx_size += len(data)
+        if self._tx_size >= settings.WRITE_COALESCE_SIZE:
+            self.flush_write()
+
+    def flush_write(self):
+        """
+        Write the coalesced frames at once; the next frame goes out
+        right away.
+        """
+        if self._tx_handle is not None:
+            self._tx_handle.cancel()
+            self._tx_handle = None
+        if not self._tx:
+            return
+        data = b''.join(self._tx)
+        self._tx.clear()
+        self._tx_size = 0
+        self._transport_write(data)
+
+    def _transport_write(self, data: bytes):
+        if self.capture is not None:
+            self.capture.write(self.port, TX, data)
+        self.metrics.tx_writes += 1
         self.transport.write(data)
 
     def pause_writing(self) -> None:
@@ -145,21 +296,58 @@ class BleProtocol(asyncio.Protocol):
 
 class BleComm:
     def __init__(self, loop, port,
-                 *args, **kwargs):
+                 *args, connector=None, **kwargs):
+        """
+        :param connector: coroutine function with the signature of
+            ``serial_asyncio.create_serial_connection``, e.g.
+            ``ble_assistant.replay.create_replay_connection``
+        """
         self.loop = loop
-        coro = serial_asyncio.create_serial_connection(loop,
-                                                       BleProtocol,
-                                                       port,
-                                                       *args,
-                                                       **kwargs)
-        transport, protocol = loop.run_until_complete(coro)
+        self.transport = None
+        self.protocol = None
+        self.log_cursor = 0
+        coro = self.open(port, *args, connector=connector, **kwargs)
+        loop.run_until_complete(coro)
+
+    @classmethod
+    async def create(cls, loop, port, *args, connector=None, **kwargs):
+        """``BleComm(...)`` for a running loop."""
+        self = cls.__new__(cls)
+        self.loop = loop
+        self.transport = None
+        self.protocol = None
+        self.log_cursor = 0
+        await self.open(port, *args, connector=connector, **kwargs)
+        return self
+
+    async def open(self, port, *args, connector=None, **kwargs):
+        if connector is None:
+            if settings.SERIAL_READER_THREAD:
+                connector = create_threaded_serial_connection
+            else:
+                connector = serial_asyncio.create_serial_connection
+        transport, protocol = await connector(self.loop,
+                                              BleProtocol,
+                                              port,
+                                              *args,
+                                              **kwargs)
+        # transports call connection_made soon, not before returning
+        await asyncio.sleep(0)
         protocol.port = port
         self.transport = transport
         self.protocol = protocol
 
     def close(self):
-        if self.transport.serial:
-            self.transport.serial.close()
+        if isinstance(self.transport, serial_asyncio.SerialTransport):
+            serial_instance = self.transport.serial
+            if os.name != 'nt' and serial_instance.is_open:
+                # unregister the fd first, a port opened next may get
+                # the same number
+                self.loop.remove_reader(serial_instance.fileno())
+                self.loop.remove_writer(serial_instance.fileno())
+            serial_instance.close()
+        else:
+            self.transport.close()
 
     def update_payload(self, obj):
         headers = obj.get_uplink_header()
@@ -176,29 +364,59 @@ class BleComm:
             await self.protocol.flow.drain()
         self.protocol.data_write(data)
 
-    async def maybe_waiting(self, endtime):
-        while self.protocol.flow.read_paused:
-            await asyncio.sleep(0.001)
-            endtime += 0.001
-        await asyncio.sleep(0.001)
-        return endtime
+    async def wait_frame(self, headers, endtime):
+        """
+        Take the oldest frame with one of ``headers`` from the mailboxes,
+        or wait until one arrives.
+
+        Time spent with reading paused does not count against
+        ``endtime``, which is on the ``time.monotonic`` clock.
+
+        :return: ``(payload, frame)``, or ``None`` at the deadline.
+        """
+        dispatcher = self.protocol.dispatcher
+        flow = self.protocol.flow
+        paused = flow.read_paused_time()
+        while True:
+            item = dispatcher.get_nowait(headers)
+            if item is not None:
+                return item
+            remaining = (endtime + flow.read_paused_time() - paused
+                         - time.monotonic())
+            if remaining <= 0.0:
+                return None
+            # the response may wait for a coalesced request
+            self.protocol.flush_write()
+            future = self.loop.create_future()
+            dispatcher.add_waiter(headers, future)
+            try:
+                await asyncio.wait([future], timeout=remaining)
+            finally:
+                # timed out or cancelled, a later frame must not go to it
+                if not future.done():
+                    dispatcher.remove_waiter(headers, future)
+            if future.done() and not future.cancelled():
+                return future.result()
 
     async def get_frame(self, opcode=None, timeout=2, num=1, or_=False):
-        endtime = time.time() + timeout
+        endtime = time.monotonic() + timeout
+        if not opcode:
+            headers = None
+        elif isinstance(opcode, list):
+            headers = set(opcode)
+        else:
+            headers = {opcode}
         res = []
         while True:
-            remaining = endtime - time.time()
-            if remaining <= 0.0:
+            item = await self.wait_frame(headers, endtime)
+            if item is None:
                 if or_ or not isinstance(opcode, list):
                     return None
                 if len(res) < len(opcode):
                     _ = [None] * (len(opcode) - len(res))
                     res.extend(_)
                 return res
-            endtime = await self.maybe_waiting(endtime)
-            if self.protocol.queue.empty():
-                continue
-            payload, frame = self.protocol.queue.get()
+            payload, frame = item
             if not opcode:
                 return payload
             if isinstance(opcode, list):
@@ -216,10 +434,46 @@ class BleComm:
             elif frame.header == opcode:
                 return payload
 
+    def dongle_log_marker(self) -> int:
+        """Cursor to pass to ``get_dongle_log`` for the logs from now on."""
+        return self.protocol.log_records.marker
+
+    def subscribe(self, headers=None, predicate=None,
+                  maxlen: int = None, payload: bool = False):
+        """
+        Async iterator over every received frame with one of
+        ``headers`` or accepted by ``predicate``, from now on.
+
+            async with comm.subscribe([b'\\xdd\\x01\\x02']) as scans:
+                async for frame in scans:
+                    ...
+
+        :param maxlen: frames buffered, ``settings.SUBSCRIBE_BUFFER``
+            by default; the oldest are dropped beyond it
+        :param payload: yield uplink payloads instead of frames
+        :return: ``Subscription``
+        """
+        if maxlen is None:
+            maxlen = settings.SUBSCRIBE_BUFFER
+        return self.protocol.dispatcher.subscribe(headers, predicate,
+                                                  maxlen, payload)
+
     def clear_dongle_log(self):
-        self.protocol.log_text = ''
+        self.log_cursor = self.dongle_log_marker()
 
-    async def get_dongle_log(self):
-        res = self.protocol.log_text
-        self.clear_dongle_log()
-        return res
+    async def get_dongle_log(self, since: int = None):
+        """
+        Dongle log text not read yet, or received since the marker ``since``.
+        Reading without ``since`` moves the read cursor past the text.
+        """
+        if since is not None:
+            return self.protocol.log_records.text(since)
+        records, self.log_cursor = self.protocol.log_records.since(self.log_cursor)
+        return ''.join(record.text for record in records)
+
+    def export_dongle_log(self, filename, since: int = None):
+        """Write the buffered dongle log, one record per line."""
+        records, _ = self.protocol.log_records.since(since)
+        with open(filename, 'at', encoding='utf8') as f:
+            for record in records:
+                f.write(record.format().rstrip('\r\n') + '\n')
@@ -67,9 +67,41 @@ class Settings(BaseSettings):
     PARSER: bool = True
     SCAN_PRINT: bool = False
     COSTTIME: bool = False
+    # append the link metrics of every dongle after each case
+    METRICS_DUMP: bool = False
     # serial
     BAUDRATE: int = 460800
     TIMEOUT: int = 2
+    # read and cut frames on a thread per port instead of the loop
+    SERIAL_READER_THREAD: bool = False
+    SERIAL_READ_SIZE: int = 64 * 1024
+    # dongle discovery: USB ids as 'vid:pid' in hex, every port if empty
+    DONGLE_VID_PID: List[str] = []
+    # seconds a port has to answer, and for the whole discovery
+    DISCOVERY_PROBE_TIMEOUT: float = 1.0
+    DISCOVERY_TIMEOUT: float = 3.0
+    # ports found to be dongles or not; a port that missed this many
+    # probes in a row is skipped for DISCOVERY_CACHE_TTL seconds
+    DISCOVERY_CACHE: str = os.path.join(os.getcwd(), 'dongles.json')
+    DISCOVERY_CACHE_MISSES: int = 2
+    DISCOVERY_CACHE_TTL: float = 24 * 3600
+    # commands in flight per dongle in Device.pipeline
+    PIPELINE_WINDOW: int = 8
+    # join frames written within the delay (seconds) after a write, up
+    # to the size, into one serial write; a lone frame is not delayed,
+    # and with no delay the window ends with the loop iteration
+    WRITE_COALESCE: bool = False
+    WRITE_COALESCE_DELAY: float = 0
+    WRITE_COALESCE_SIZE: int = 4096
+    # frames kept per uplink header until they are read
+    MAILBOX_SIZE: int = 1024
+    # bound of all frames kept per port, and what to do beyond it:
+    # drop-oldest, drop-newest or pause (reading until half drained)
+    RX_QUEUE_MAX_FRAMES: int = 8192
+    RX_QUEUE_MAX_BYTES: int = 4 * 1024 * 1024
+    RX_QUEUE_POLICY: str = 'drop-oldest'
+    # frames buffered per subscriber until they are read
+    SUBSCRIBE_BUFFER: int = 1024
     # protocol
     BYTE_ORDER = 'little'
     HEADER_DOWNLINK: bytes = b'\xaa'
@@ -112,15 +144,25 @@ class Settings(BaseSettings):
     LOG_NAME: str = 'ble_test'
     LOG_LEVEL: int = logging.DEBUG
     LOG_STDOUT: bool = True
+    # format and write logs on a background thread
+    LOG_QUEUE: bool = False
     LOG_FORMATTER: str = '[%(asctime)s][%(levelname)s][%(funcName)s]%(message)s'
     DONGLE_LOG_NAME: str = 'ble_dongle'
     DONGLE_LOG_ENABLE: bool = True
+    # keep dongle logs raw until they are read
+    DONGLE_LOG_LAZY: bool = False
+    # dongle log records kept per port for get_dongle_log
+    DONGLE_LOG_MAX_RECORDS: int = 20000
+    DONGLE_LOG_MAX_BYTES: int = 1024 * 1024
     DONGLE_LOG_FORMATTER: str = '[%(asctime)s]%(message)s'
     DONGLE_LOG_BACKUP_COUNT: int = 100
     SERIAL_LOG_NAME: str = 'serial'
     SERIAL_LOG_ENABLE: bool = True
     SERIAL_LOG_FORMATTER: str = '[%(asctime)s]%(message)s'
     SERIAL_LOG_BACKUP_COUNT: int = 100
+    # binary capture of rx and tx, instead of the text serial log
+    SERIAL_CAPTURE_ENABLE: bool = False
+    SERIAL_CAPTURE_FLUSH_INTERVAL: float = 1.0
 
     # url or ip
     TEST_MANAGE_URL: HttpUrl = 'http://localhost:8080'
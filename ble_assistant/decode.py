@@ -0,0 +1,171 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Decode captured serial logs offline.
+
+The serial logger writes every received chunk as ``repr(bytes)`` per
+port. This rebuilds the byte stream of each port, runs it through the
+frame decoder and writes the frames out as text, one output file per
+input file. Binary captures (see ``ble_assistant.capture``) are read
+as well, their received chunks only. Files are decoded in parallel by
+a process pool; each worker streams its file.
+
+    python -m ble_assistant.decode logs/serial/logger* -o decoded
+"""
+
+import os
+import re
+import ast
+import time
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ble_assistant.parser import FrameDecoder, is_log_frame
+from ble_assistant.donglelog import DongleLogRecord
+from ble_assistant.capture import CaptureReader, is_capture_file, RX
+
+LINE_PATTERN = re.compile(r'^\[(?P<time>[^\]]*)\]'
+                          r'\[(?P<port>[^\]]*)\](?:\[[^\]]*\])* '
+                          r'(?P<data>b([\'"]).*\4)$')
+# the console coloring also ends up in the log files
+ANSI_PATTERN = re.compile(r'\x1b\[[0-9;]*m')
+
+
+def iter_serial_log(filename):
+    """
+    Yield ``(time, port, data)`` for every chunk in a serial log file.
+    """
+    with open(filename, encoding='utf8', errors='replace') as f:
+        for line in f:
+            line = ANSI_PATTERN.sub('', line).rstrip('\r\n')
+            match = LINE_PATTERN.match(line)
+            if match is None:
+                continue
+            try:
+                data = ast.literal_eval(match.group('data'))
+            except (ValueError, SyntaxError):
+                continue
+            yield match.group('time'), match.group('port'), data
+
+
+def iter_capture(filename):
+    """
+    Yield ``(time, port, data)`` for every received chunk of a capture.
+    """
+    with CaptureReader(filename) as reader:
+        for record in reader:
+            if record.direction != RX:
+                continue
+            wall = reader.wall_time(record.timestamp)
+            timestamp = (time.strftime('%Y-%m-%d %H:%M:%S',
+                                       time.localtime(wall))
+                         + f',{int(wall * 1000) % 1000:03d}')
+            yield timestamp, record.port, bytes(record.data)
+
+
+def format_frame(timestamp, port, frame):
+    if is_log_frame(frame):
+        text = DongleLogRecord(frame).text.rstrip('\r\n')
+        return f'[{timestamp}][{port}] {text}'
+    return f'[{timestamp}][{port}]<<< {frame.raw_data.hex()}'
+
+
+def decode_file(filename, output, chunks=None):
+    """
+    Decode one capture file into ``output``.
+
+    :param chunks: iterable of ``(time, port, data)``, read from
+        ``filename`` by default.
+    :return: file name, output name, frame count and the noise counters
+        of every port.
+    """
+    if chunks is None:
+        if is_capture_file(filename):
+            chunks = iter_capture(filename)
+        else:
+            chunks = iter_serial_log(filename)
+    decoders = {}
+    count = 0
+    with open(output, 'wt', encoding='utf8') as out:
+        for timestamp, port, data in chunks:
+            decoder = decoders.get(port)
+            if decoder is None:
+                decoder = decoders[port] = FrameDecoder()
+            for frame in decoder.feed(data):
+                out.write(format_frame(timestamp, port, frame) + '\n')
+                count += 1
+    quality = {port: {'discarded': decoder.discarded,
+                      'resyncs': decoder.resyncs,
+                      'remain': len(decoder)}
+               for port, decoder in decoders.items()}
+    return filename, output, count, quality
+
+
+def output_names(filenames, output_dir):
+    """One output file per input, without clobbering equal base names."""
+    names = {}
+    for filename in filenames:
+        name = os.path.basename(filename)
+        output = os.path.join(output_dir, f'{name}.decoded')
+        i = 1
+        while output in names.values():
+            output = os.path.join(output_dir, f'{name}.{i}.decoded')
+            i += 1
+        names[filename] = output
+    return names
+
+
+def decode_files(filenames, output_dir, workers=None):
+    """
+    Decode files in a process pool, yielding results as they finish.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    names = output_names(filenames, output_dir)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(decode_file, filename, output)
+                   for filename, output in names.items()]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def expand_paths(paths):
+    res = []
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path, '*')
+        for filename in sorted(glob.glob(path)):
+            if os.path.isfile(filename) and filename not in res:
+                res.append(filename)
+    return res
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m ble_assistant.decode',
+        description='Decode captured serial logs into frames.',
+    )
+    arg_parser.add_argument('paths', nargs='+',
+                            help='serial logs or captures, directories or globs')
+    arg_parser.add_argument('-o', '--output', default='decoded',
+                            help='output directory')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help='worker processes, CPU count by default')
+    args = arg_parser.parse_args(argv)
+    filenames = expand_paths(args.paths)
+    if not filenames:
+        arg_parser.error('no input files')
+    total = 0
+    for filename, output, count, quality in decode_files(filenames,
+                                                         args.output,
+                                                         args.jobs):
+        total += count
+        print(f'{filename} -> {output}: {count} frames {quality}')
+    print(f'{len(filenames)} files, {total} frames')
+
+
+if __name__ == '__main__':
+    main()
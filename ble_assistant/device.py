@@ -4,28 +4,103 @@
 All rights reserved.
 """
 
+import time
 import inspect
 import asyncio
 
 from ble_assistant.config import settings
 from ble_assistant.comm import BleComm
+from ble_assistant.parser import codec
+from ble_assistant.payload import BasePayload
 from ble_assistant.finder import fuzzy_finder
 from ble_assistant.utils import load_modules
 
 
+class Command:
+    """
+    Command of a device for one payload class, built once when the
+    payloads load. Calling it writes the downlink frame and returns
+    the uplink payload, or ``None`` on timeout.
+
+    Its signature and doc are those of the payload's
+    ``downlink_payload`` and class.
+    """
+
+    def __init__(self, device, payload):
+        self.device = device
+        self.payload = payload
+        self.name = getattr(payload, 'name', None)
+        self.downlink_header = payload.get_downlink_header()
+        self.uplink_header = payload.get_uplink_header()
+        self.func = payload.downlink_payload
+        self.__signature__ = inspect.signature(self.func)
+        doc = payload.__doc__
+        if doc:
+            doc = doc.strip().replace('\n', ' ')
+        self.__doc__ = doc
+        # payloads that build their own frame keep doing so
+        if getattr(payload.downlink, '__func__', None) is BasePayload.downlink.__func__:
+            self.downlink = self._downlink
+        else:
+            self.downlink = payload.downlink
+
+    def __repr__(self):
+        return f'<Command {self.name}{self.__signature__}>'
+
+    def _downlink(self, *args, **kwargs):
+        payload = self.func(*args, **kwargs)
+        return codec.encode(self.downlink_header, payload or b'')
+
+    async def __call__(self, *args, **kwargs):
+        timeout = kwargs.pop('timeout', settings.TIMEOUT)
+        num = kwargs.pop('num', 1)
+        ser = self.device.ser
+        downlink = self.downlink(*args, **kwargs)
+        if downlink is not None:
+            await ser.write(downlink)
+        return await ser.get_frame(self.uplink_header,
+                                   timeout=timeout,
+                                   num=num)
+
+
 class Device:
     def __init__(self, loop, port,
                  *args, **kwargs):
         self.ser = BleComm(loop, port,
                            *args, **kwargs)
+        self._setup(port)
+        coro = loop.create_task(self.device_information_get())
+        loop.run_until_complete(coro)
+
+    @classmethod
+    async def create(cls, loop, port, *args,
+                     info_timeout: float = 1, **kwargs):
+        """
+        ``Device(...)`` for a running loop, so that ports can be opened
+        and asked for their information concurrently.
+        :param info_timeout: seconds to wait for the device information
+        :return: the device, with ``info`` None if it did not answer
+        """
+        ser = await BleComm.create(loop, port, *args, **kwargs)
+        self = cls.__new__(cls)
+        self.ser = ser
+        try:
+            self._setup(port)
+            await self.device_information_get(info_timeout)
+        except BaseException:
+            # cancelled at the discovery deadline as well
+            ser.close()
+            raise
+        return self
+
+    def _setup(self, port):
         self.port = port
         self.payloads = {}
+        self.commands = {}
         pkg = f'ble_assistant.payload.{settings.DEVICE}'
         self.modules = load_modules(pkg)
         self.load_payload()
         self.info = None
-        coro = loop.create_task(self.device_information_get())
-        loop.run_until_complete(coro)
 
     @property
     def name(self):
@@ -36,7 +111,7 @@ class Device:
         self.ser.protocol.name = value
 
     def serial_clear(self):
-        self.ser.protocol.queue.queue.clear()
+        self.ser.protocol.dispatcher.clear()
 
     def close(self):
         self.ser.close()
@@ -56,32 +131,30 @@ class Device:
                     raise NameError(msg)
                 self.ser.update_payload(obj)
                 self.payloads[name] = obj
+                command = self.commands[name] = Command(self, obj)
                 refer = getattr(obj, 'refer', None)
                 if refer:
                     if refer in self.payloads:
                         msg = f'Refer name "{refer}" conflict: {obj}, {self.payloads[refer]}'
                         raise NameError(msg)
                     self.payloads[refer] = obj
+                    self.commands[refer] = command
 
-    async def device_information_get(self):
+    async def device_information_get(self, timeout: float = 1):
         func = self.__getattr__('device_information_get')
-        info = await func(timeout=1)
+        info = await func(timeout=timeout)
         if info:
             self.info = info
         return info
 
     def search(self, api_name):
-        collections = self.payloads.keys()
+        collections = self.commands.keys()
         results = fuzzy_finder(api_name, collections)
         res = []
         for name in results:
-            cls = self.payloads[name]
-            func = cls.downlink_payload
-            args = inspect.signature(func).parameters
-            doc = cls.__doc__
-            if doc:
-                doc = doc.strip().replace('\n', ' ')
-            res.append((name, args, doc, func))
+            command = self.commands[name]
+            res.append((name, command.__signature__.parameters,
+                        command.__doc__, command.func))
         return res
 
     def get_function(self, name):
@@ -91,20 +164,14 @@ class Device:
         return cls.downlink_payload
 
     def __getattr__(self, name):
+        # only reached for names that are not attributes, and before
+        # __init__ has set commands as well
+        command = self.__dict__.get('commands', {}).get(name)
+        if command is not None:
+            return command
+
         async def write_and_read(*args, **kwargs):
-            timeout = kwargs.pop('timeout', settings.TIMEOUT)
-            num = kwargs.pop('num', 1)
-            item = self.payloads.get(name)
-            if not item:
-                raise AttributeError('method not found')
-            downlink = item.downlink(*args, **kwargs)
-            if downlink is not None:
-                await self.ser.write(downlink)
-            header = item.get_uplink_header()
-            payload = await self.ser.get_frame(header,
-                                               timeout=timeout,
-                                               num=num)
-            return payload
+            raise AttributeError('method not found')
 
         return write_and_read
 
@@ -119,6 +186,35 @@ class Device:
         payloads = await self.ser.get_frame(headers, timeout, -1)
         return payloads
 
+    def subscribe(self, names: list, maxlen: int = None):
+        """
+        Async iterator over the uplink payloads of the commands ``names``,
+        e.g. indications, see ``BleComm.subscribe``.
+        :param names:
+        :param maxlen:
+        :return:
+        """
+        headers = []
+        for name in names:
+            command = self.commands.get(name)
+            if not command:
+                raise KeyError('method not found')
+            header = command.uplink_header
+            if isinstance(header, list):
+                headers.extend(header)
+            else:
+                headers.append(header)
+        return self.ser.subscribe(headers, maxlen=maxlen, payload=True)
+
+    def pipeline(self, window: int = None):
+        """
+        Pipelined commands, see ``Pipeline``.
+        :param window: commands in flight, ``settings.PIPELINE_WINDOW``
+            by default
+        :return:
+        """
+        return Pipeline(self, window)
+
     def pause(self):
         self.ser.protocol.flow.pause_writing()
         self.ser.protocol.flow.pause_reading()
@@ -128,9 +224,105 @@ class Device:
         self.ser.protocol.flow.resume_reading()
 
 
+class Pipeline:
+    """
+    Commands of a device sent without waiting for each response.
+
+    ``submit`` takes the same arguments as a device command and returns
+    a task with its response. Commands are written in submit order, up
+    to ``window`` of them waiting for a response at a time. Responses
+    are matched to commands by uplink header in the same order, so
+    commands sharing a header get their own response. The timeout of
+    a command runs from its write.
+
+        async with device.pipeline(8) as pipe:
+            for addr in addrs:
+                pipe.submit('config_set', addr, timeout=1)
+            async for result in pipe:
+                ...
+    """
+
+    def __init__(self, device, window: int = None):
+        self.device = device
+        self.window = window or settings.PIPELINE_WINDOW
+        self.tasks = []
+        self._slots = asyncio.Semaphore(self.window)
+        self._written = None
+        # uplink header -> future done when the last command read it
+        self._reads = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def __aiter__(self):
+        """Responses in submit order."""
+        i = 0
+        while i < len(self.tasks):
+            yield await self.tasks[i]
+            i += 1
+
+    def submit(self, name, *args, **kwargs) -> asyncio.Task:
+        timeout = kwargs.pop('timeout', settings.TIMEOUT)
+        num = kwargs.pop('num', 1)
+        command = self.device.commands.get(name)
+        if not command:
+            raise AttributeError('method not found')
+        downlink = command.downlink(*args, **kwargs)
+        header = command.uplink_header
+        key = tuple(header) if isinstance(header, list) else header
+        loop = asyncio.get_event_loop()
+        previous = self._written, self._reads.get(key)
+        self._written = written = loop.create_future()
+        self._reads[key] = read = loop.create_future()
+        task = loop.create_task(self._run(downlink, header, timeout, num,
+                                          previous, written))
+        # also when cancelled before it started running
+        task.add_done_callback(lambda _: self._release(written, read))
+        self.tasks.append(task)
+        return task
+
+    @staticmethod
+    def _release(*futures):
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    async def _run(self, downlink, header, timeout, num,
+                   previous, written):
+        prev_written, prev_read = previous
+        # asyncio.wait, since awaiting a shared future directly would
+        # cancel it along with this task
+        if prev_written is not None:
+            await asyncio.wait([prev_written])
+        async with self._slots:
+            if downlink is not None:
+                await self.device.ser.write(downlink)
+            endtime = time.monotonic() + timeout
+            self._release(written)
+            if prev_read is not None:
+                await asyncio.wait([prev_read])
+            remaining = max(endtime - time.monotonic(), 0.0)
+            return await self.device.ser.get_frame(header,
+                                                   timeout=remaining,
+                                                   num=num)
+
+    async def gather(self) -> list:
+        """Wait for every command, responses in submit order."""
+        return await asyncio.gather(*self.tasks)
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
+
+
 class DeviceManager:
     def __init__(self, devices):
-        self.deivces = devices
+        self.devices = devices
 
     def __getattr__(self, item):
         async def call(*args, **kwargs):
@@ -138,13 +330,16 @@ class DeviceManager:
             result = []
             for device in self.devices:
                 method = getattr(device, item)
-                if asyncio.iscoroutinefunction(method):
+                if (isinstance(method, Command)
+                        or asyncio.iscoroutinefunction(method)):
                     coros.append(method(*args, **kwargs))
                 elif inspect.ismethod(method):
                     # coros.append(asyncio.to_thread(method, *args, **kwargs)) # 3.9+
                     result.append(method(*args, **kwargs))
             return await asyncio.gather(*coros) or result
 
+        # built once per name, later lookups find the attribute
+        self.__dict__[item] = call
         return call
 
     def __getitem__(self, index):
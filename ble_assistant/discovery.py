@@ -0,0 +1,253 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Concurrent dongle discovery.
+
+Every candidate port is opened and asked for its device information
+at once, so discovery takes about one probe timeout however many ports
+there are; ports still unanswered at the global deadline are given up.
+
+Candidates are the COM ports with a USB id in
+``settings.DONGLE_VID_PID``, every port if it is empty. What each port
+turned out to be is kept in ``settings.DISCOVERY_CACHE``, by port name
+and hardware id:
+
+- a port known to be a dongle is probed first and asked again until
+  the deadline, so a dongle that is still booting is not given up
+  after one probe timeout; a change of its information is logged
+- a port that missed ``settings.DISCOVERY_CACHE_MISSES`` probes in a
+  row is skipped, until ``settings.DISCOVERY_CACHE_TTL`` seconds after
+  its last probe or a rescan
+"""
+
+import os
+import json
+import time
+import asyncio
+
+import serial
+from serial.tools import list_ports
+
+from ble_assistant import logger
+from ble_assistant.config import settings
+from ble_assistant.device import Device
+
+
+def parse_vid_pid(items) -> set:
+    """``{(vid, pid)}`` of ``'vid:pid'`` strings in hex."""
+    res = set()
+    for item in items:
+        vid, _, pid = item.partition(':')
+        res.add((int(vid, 16), int(pid, 16)))
+    return res
+
+
+class PortCache:
+    """
+    What the ports were found to be, by port name, in a JSON file:
+    ``{'hwid': ..., 'dongle': bool, 'info': str, 'misses': int,
+    'checked': seconds since the epoch}``.
+    """
+
+    def __init__(self, path: str = None):
+        if path is None:
+            path = settings.DISCOVERY_CACHE
+        self.path = path
+        self.ports = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.ports = json.load(f)
+            except (OSError, ValueError) as exc:
+                logger.warning('discovery cache %s ignored: %s', path, exc)
+
+    def _entry(self, com_port):
+        entry = self.ports.get(com_port.device)
+        if entry is None or entry.get('hwid') != com_port.hwid:
+            return None
+        return entry
+
+    def known_dongle(self, com_port) -> bool:
+        """Whether the port was a dongle last time, with the same hardware."""
+        entry = self._entry(com_port)
+        return entry is not None and entry['dongle']
+
+    def known_other(self, com_port) -> bool:
+        """
+        Whether the port, with the same hardware, missed enough probes
+        in a row recently to be skipped.
+        """
+        entry = self._entry(com_port)
+        if entry is None or entry['dongle']:
+            return False
+        if entry.get('misses', 0) < settings.DISCOVERY_CACHE_MISSES:
+            return False
+        return time.time() - entry.get('checked', 0) < settings.DISCOVERY_CACHE_TTL
+
+    def update(self, com_port, dongle):
+        entry = self._entry(com_port)
+        if dongle is not None:
+            info = str(dongle.info)
+            if entry is not None and entry['dongle'] and entry['info'] != info:
+                logger.info('[%s]dongle changed: %s -> %s',
+                            com_port.device, entry['info'], info)
+            misses = 0
+        else:
+            info = None
+            misses = 1
+            if entry is not None and not entry['dongle']:
+                misses += entry.get('misses', 0)
+        self.ports[com_port.device] = {
+            'hwid': com_port.hwid,
+            'dongle': dongle is not None,
+            'info': info,
+            'misses': misses,
+            'checked': time.time(),
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.ports, f, indent=2)
+        except OSError as exc:
+            logger.warning('discovery cache %s not saved: %s', self.path, exc)
+
+
+def candidate_ports(cache: PortCache = None) -> list:
+    """
+    COM ports that may be dongles, filtered by ``settings.DONGLE_VID_PID``;
+    with a ``cache``, known dongles first and without the ports that
+    keep missing probes.
+    """
+    ids = parse_vid_pid(settings.DONGLE_VID_PID)
+    res = []
+    for com_port in list_ports.comports():
+        if ids and (com_port.vid, com_port.pid) not in ids:
+            continue
+        if cache is not None and cache.known_other(com_port):
+            logger.info('[%s]skipped, no answer to the last probes',
+                        com_port.device)
+            continue
+        res.append(com_port)
+    if cache is not None:
+        res.sort(key=lambda com_port: not cache.known_dongle(com_port))
+    return res
+
+
+async def probe(loop, port, *args, info_timeout: float = 1,
+                persist: bool = False, **kwargs):
+    """
+    Open ``port`` and ask for its device information.
+    :param persist: ask again after every timeout, until cancelled
+    :return: the device, or None if it did not answer
+    """
+    dongle = await Device.create(loop, port, *args,
+                                 info_timeout=info_timeout, **kwargs)
+    try:
+        while persist and not dongle.info:
+            await dongle.device_information_get(info_timeout)
+    except BaseException:
+        dongle.close()
+        raise
+    if dongle.info:
+        return dongle
+    dongle.close()
+    return None
+
+
+async def discover(loop, ports, *args,
+                   deadline: float = None,
+                   info_timeout: float = None,
+                   persist=(),
+                   **kwargs) -> list:
+    """
+    Probe ``ports`` concurrently, serial arguments go to ``Device``.
+    :param deadline: seconds for all probes, ``settings.DISCOVERY_TIMEOUT``
+        by default
+    :param info_timeout: seconds a port has to answer,
+        ``settings.DISCOVERY_PROBE_TIMEOUT`` by default
+    :param persist: ports asked again until the deadline
+    :return: per port, the device, None if it did not answer, or the
+        exception if it could not be opened, ``asyncio.TimeoutError``
+        at the deadline
+    """
+    if deadline is None:
+        deadline = settings.DISCOVERY_TIMEOUT
+    if info_timeout is None:
+        info_timeout = settings.DISCOVERY_PROBE_TIMEOUT
+    if not ports:
+        return []
+    tasks = [loop.create_task(probe(loop, port, *args,
+                                    info_timeout=info_timeout,
+                                    persist=port in persist, **kwargs))
+             for port in ports]
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        # let the cancelled probes close their ports
+        await asyncio.wait(pending)
+    res = []
+    for port, task in zip(ports, tasks):
+        if task.cancelled():
+            logger.warning('[%s]no answer within the discovery deadline', port)
+            res.append(asyncio.TimeoutError())
+        elif task.exception() is not None:
+            res.append(task.exception())
+        else:
+            res.append(task.result())
+    return res
+
+
+async def discover_dongles(loop, ports=None, *args,
+                           rescan: bool = False, **kwargs) -> list:
+    """
+    Connect the dongles on ``ports``, or on the candidate COM ports.
+    :param rescan: probe the ports that keep missing probes too
+    :return: devices that answered, in the order of the ports
+    """
+    cache = None
+    com_ports = {}
+    persist = set()
+    if ports is None:
+        cache = PortCache()
+        for com_port in candidate_ports(cache):
+            com_ports[com_port.device] = com_port
+            if cache.known_dongle(com_port):
+                persist.add(com_port.device)
+        if rescan:
+            com_ports.update((com_port.device, com_port)
+                             for com_port in candidate_ports())
+        ports = list(com_ports)
+    results = await discover(loop, ports, *args, persist=persist, **kwargs)
+    dongles = []
+    error = None
+    for port, res in zip(ports, results):
+        if isinstance(res, serial.serialutil.SerialException):
+            print("SerialException: can't configure port {}".format(port))
+            print(str(res))
+            continue
+        if isinstance(res, asyncio.TimeoutError):
+            # too slow this time, a known dongle counts a miss
+            if port in persist:
+                logger.warning('[%s]known dongle did not answer', port)
+                cache.update(com_ports[port], None)
+            continue
+        if isinstance(res, BaseException):
+            error = error or res
+            continue
+        if res is not None:
+            dongles.append(res)
+        if port in com_ports:
+            cache.update(com_ports[port], res)
+    if cache is not None:
+        cache.save()
+    if error is not None:
+        for dongle in dongles:
+            dongle.close()
+        raise error
+    return dongles
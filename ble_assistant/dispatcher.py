@@ -0,0 +1,368 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+"""
+
+import time
+import asyncio
+import weakref
+from collections import deque
+from itertools import count
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+PAUSE = 'pause'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, PAUSE)
+
+
+class Mailbox:
+    """
+    Bounded FIFO of ``(seq, size, (payload, frame), received)`` for one
+    header.
+    """
+    __slots__ = ('items', 'maxlen', 'dropped')
+
+    def __init__(self, maxlen: int = None):
+        self.items = deque()
+        self.maxlen = maxlen
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def full(self) -> bool:
+        return self.maxlen is not None and len(self.items) >= self.maxlen
+
+
+class Subscription:
+    """
+    Async iterator over the frames of a port that match ``headers`` or
+    ``predicate``.
+
+    Every subscriber gets the same frame objects, in a buffer of its
+    own that drops the oldest frame when full; ``dropped`` counts them.
+    Closing it, or leaving its ``async with`` block, unsubscribes; so
+    does dropping the last reference to it.
+    """
+
+    def __init__(self, dispatcher, headers=None, predicate=None,
+                 maxlen: int = None, payload: bool = False):
+        """
+        :param headers: uplink headers, ``None`` for all
+        :param predicate: called with each frame, on top of ``headers``
+        :param maxlen: frames buffered until they are read
+        :param payload: yield the uplink payload instead of the frame
+        """
+        self.dispatcher = dispatcher
+        self.headers = None if headers is None else set(headers)
+        self.predicate = predicate
+        self.items = deque(maxlen=maxlen)
+        self.index = 0 if payload else 1
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self._waiter = None
+
+    def __len__(self):
+        return len(self.items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.items:
+            if self.closed:
+                raise StopAsyncIteration
+            self._waiter = asyncio.get_event_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self.items.popleft()[self.index]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def get(self, timeout: float = None):
+        """Next frame, or ``None`` after ``timeout`` seconds or once closed."""
+        try:
+            return await asyncio.wait_for(self.__anext__(), timeout)
+        except (asyncio.TimeoutError, StopAsyncIteration):
+            return None
+
+    def matches(self, frame) -> bool:
+        if self.headers is not None and frame.header not in self.headers:
+            return False
+        return self.predicate is None or self.predicate(frame)
+
+    def put(self, item):
+        if len(self.items) == self.items.maxlen:
+            self.dropped += 1
+        self.items.append(item)
+        self.received += 1
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def close(self):
+        """Unsubscribe; frames already buffered can still be read."""
+        if self.closed:
+            return
+        self.closed = True
+        self.dispatcher.unsubscribe(self)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def aclose(self):
+        self.close()
+
+
+class FrameDispatcher:
+    """
+    Hand received frames straight to the coroutines waiting for them.
+
+    A waiter registers the headers it accepts, or ``None`` for any
+    frame, together with a future that is resolved with the first
+    matching ``(payload, frame)``. Waiters are served in the order
+    they registered. Subscriptions see every matching frame before
+    that, without taking it from waiters or mailboxes.
+
+    Frames nobody waits for are kept in a mailbox per header, so
+    waiting for one header never consumes frames of another. A
+    sequence number keeps the arrival order across mailboxes.
+
+    Each mailbox is bounded by ``maxlen`` and all of them together by
+    ``max_frames`` and ``max_bytes``. When a bound is exceeded the
+    ``policy`` drops the oldest frame, of the mailbox or of the port,
+    drops the new frame, or calls ``throttle(True)`` until readers bring
+    every mailbox and the port back under half their bounds. Frames are
+    copied out of the decoder buffer when they are kept, so a kept frame
+    holds its own bytes only.
+    """
+
+    def __init__(self, maxlen: int = None, *,
+                 max_frames: int = None,
+                 max_bytes: int = None,
+                 policy: str = DROP_OLDEST,
+                 throttle=None):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown queue policy "{policy}", '
+                             f'expect one of {POLICIES}')
+        self.maxlen = maxlen
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.throttle = throttle
+        self.throttled = False
+        # seconds spent throttled, up to the last resume
+        self.throttled_time = 0.0
+        self._throttled_at = None
+        # Histogram of seconds from dispatch until a frame is taken
+        self.wait = None
+        self.mailboxes = {}
+        self.subscribers = weakref.WeakSet()
+        # header -> {order: future} in order; None for any header
+        self.waiters = {}
+        # future -> (order, headers), to unregister it from every header
+        self._registered = {}
+        self._seq = count()
+        self._order = count()
+        self.depth = 0
+        self.size = 0
+        self.peak_depth = 0
+        self.peak_size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.depth
+
+    def mailbox(self, header) -> Mailbox:
+        mailbox = self.mailboxes.get(header)
+        if mailbox is None:
+            mailbox = self.mailboxes[header] = Mailbox(self.maxlen)
+        return mailbox
+
+    def dispatch(self, item):
+        """Deliver ``(payload, frame)`` to a waiter or its mailbox."""
+        header = item[1].header
+        if self.subscribers:
+            for subscriber in list(self.subscribers):
+                if subscriber.matches(item[1]):
+                    subscriber.put(item)
+        future = self._pop_waiter(header)
+        if future is not None:
+            future.set_result(item)
+            if self.wait is not None:
+                self.wait.add(0.0)
+            return
+        size = item[1].length
+        mailbox = self.mailbox(header)
+        if self.policy == DROP_NEWEST and (mailbox.full or
+                                           self._over(1, size)):
+            mailbox.dropped += 1
+            self.dropped += 1
+            return
+        if self.policy == DROP_OLDEST and mailbox.full:
+            self._pop(mailbox)
+            mailbox.dropped += 1
+            self.dropped += 1
+        # a kept frame must not hold the whole buffer it was cut from
+        item = (item[0], item[1].detach())
+        mailbox.items.append((next(self._seq), size, item, time.monotonic()))
+        self.depth += 1
+        self.size += size
+        if self.policy == PAUSE:
+            if mailbox.full or self._over():
+                self._throttle(True)
+        elif self.policy == DROP_OLDEST and self._over():
+            while self.depth and self._over():
+                mailbox = self._oldest(self.mailboxes.values())
+                self._pop(mailbox)
+                mailbox.dropped += 1
+                self.dropped += 1
+        self.peak_depth = max(self.peak_depth, self.depth)
+        self.peak_size = max(self.peak_size, self.size)
+
+    def _over(self, frames: int = 0, size: int = 0) -> bool:
+        if self.max_frames is not None and self.depth + frames > self.max_frames:
+            return True
+        return self.max_bytes is not None and self.size + size > self.max_bytes
+
+    def _throttle(self, on: bool):
+        if self.throttled != on:
+            self.throttled = on
+            now = time.monotonic()
+            if on:
+                self._throttled_at = now
+            else:
+                self.throttled_time += now - self._throttled_at
+            if self.throttle is not None:
+                self.throttle(on)
+
+    def _pop(self, mailbox):
+        _, size, item, _ = mailbox.items.popleft()
+        self.depth -= 1
+        self.size -= size
+        return item
+
+    def _first_waiter(self, key):
+        waiters = self.waiters.get(key)
+        if not waiters:
+            return None
+        order = next(iter(waiters))
+        return order, waiters[order]
+
+    def _pop_waiter(self, header):
+        first = self._first_waiter(header)
+        any_ = self._first_waiter(None)
+        if any_ is not None and (first is None or any_[0] < first[0]):
+            first = any_
+        if first is None:
+            return None
+        future = first[1]
+        self._discard_waiter(future)
+        return future
+
+    def _discard_waiter(self, future):
+        order, keys = self._registered.pop(future, (None, ()))
+        for key in keys:
+            waiters = self.waiters.get(key)
+            if waiters is not None:
+                waiters.pop(order, None)
+                if not waiters:
+                    del self.waiters[key]
+
+    @staticmethod
+    def _oldest(mailboxes):
+        oldest = None
+        for mailbox in mailboxes:
+            if mailbox.items and (oldest is None or
+                                  mailbox.items[0][0] < oldest.items[0][0]):
+                oldest = mailbox
+        return oldest
+
+    def get_nowait(self, headers=None):
+        """
+        Oldest ``(payload, frame)`` with one of ``headers``, or ``None``.
+        """
+        if headers is None:
+            mailboxes = self.mailboxes.values()
+        else:
+            mailboxes = [self.mailboxes[header] for header in headers
+                         if header in self.mailboxes]
+        oldest = self._oldest(mailboxes)
+        if oldest is None:
+            return None
+        if self.wait is not None:
+            self.wait.add(time.monotonic() - oldest.items[0][3])
+        item = self._pop(oldest)
+        if self.throttled and self._drained():
+            self._throttle(False)
+        return item
+
+    def _drained(self) -> bool:
+        if self.max_frames is not None and self.depth > self.max_frames // 2:
+            return False
+        if self.max_bytes is not None and self.size > self.max_bytes // 2:
+            return False
+        return self.maxlen is None or all(
+            len(mailbox) <= self.maxlen // 2
+            for mailbox in self.mailboxes.values())
+
+    def add_waiter(self, headers, future):
+        order = next(self._order)
+        keys = list(headers) if headers is not None else [None]
+        self._registered[future] = (order, keys)
+        for key in keys:
+            self.waiters.setdefault(key, {})[order] = future
+
+    def remove_waiter(self, headers, future):
+        """Unregister ``future`` from all its headers and cancel it."""
+        self._discard_waiter(future)
+        if not future.done():
+            future.cancel()
+
+    def subscribe(self, headers=None, predicate=None,
+                  maxlen: int = None, payload: bool = False) -> Subscription:
+        subscription = Subscription(self, headers, predicate, maxlen, payload)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def clear(self):
+        for mailbox in self.mailboxes.values():
+            mailbox.items.clear()
+        self.depth = 0
+        self.size = 0
+        self._throttle(False)
+
+    def stats(self) -> dict:
+        """Depth and drop count of every mailbox, keyed by header hex."""
+        return {header.hex(): {'depth': len(mailbox),
+                               'dropped': mailbox.dropped}
+                for header, mailbox in self.mailboxes.items()}
+
+    def queue_stats(self) -> dict:
+        """Totals over all mailboxes of the port."""
+        throttled = self.throttled_time
+        if self.throttled:
+            throttled += time.monotonic() - self._throttled_at
+        return {'depth': self.depth,
+                'bytes': self.size,
+                'peak_depth': self.peak_depth,
+                'peak_bytes': self.peak_size,
+                'dropped': self.dropped,
+                'throttled_s': round(throttled, 3),
+                'policy': self.policy}
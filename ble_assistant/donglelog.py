@@ -0,0 +1,137 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+"""
+
+import time
+from collections import deque
+from itertools import islice
+
+from ble_assistant.config import settings
+from ble_assistant.parser import get_log_parser, raw_log_text
+
+
+class DongleLogRecord:
+    """
+    A dongle log frame and the time it was received.
+
+    The text is rendered on first use, so a record that is never read
+    or emitted by a log handler never gets decoded.
+    """
+    __slots__ = ('timestamp', 'header', 'payload', '_text')
+
+    def __init__(self, frame, timestamp: float = None, lazy: bool = True):
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.header = frame.header
+        payload = frame.payload
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        self.payload = payload
+        self._text = None
+        if not lazy:
+            self._text = self.render()
+
+    def __str__(self):
+        return self.text
+
+    def __len__(self):
+        return len(self.payload)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.render()
+        return self._text
+
+    def render(self) -> str:
+        payload = self.payload
+        if isinstance(payload, str):
+            return payload
+        if self.header == settings.HEADER_BALI_LOG:
+            log_parser = get_log_parser()
+            if log_parser is None:
+                return raw_log_text(payload)
+            return log_parser.parse_log(payload)
+        try:
+            return payload.decode('utf8')
+        except UnicodeDecodeError:
+            return str(payload)
+
+    def format(self) -> str:
+        """Text line with the receive time, as used for export."""
+        ts = time.strftime('%Y-%m-%d %H:%M:%S',
+                           time.localtime(self.timestamp))
+        ms = int(self.timestamp * 1000) % 1000
+        return f'[{ts},{ms:03d}]{self.text}'
+
+
+class DongleLogBuffer:
+    """
+    Ring buffer of the latest dongle log records.
+
+    Every record gets a sequence number. A cursor is the sequence number
+    of the next record to read, so ``marker`` taken now and passed to
+    ``since`` later returns exactly the records received in between,
+    without rescanning the text. Only whole records are evicted once
+    ``max_records`` or ``max_bytes`` of payload is exceeded; a cursor
+    older than the buffer reads from the oldest record kept.
+    """
+
+    def __init__(self, max_records: int = None, max_bytes: int = None):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.records = deque()
+        self.size = 0
+        self.first = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    @property
+    def marker(self) -> int:
+        """Cursor just past the newest record."""
+        return self.first + len(self.records)
+
+    def append(self, record: DongleLogRecord) -> int:
+        """
+        Add ``record`` and evict the oldest ones beyond the limits.
+        :param record:
+        :return: sequence number of ``record``
+        """
+        self.records.append(record)
+        self.size += len(record)
+        while len(self.records) > 1 and self._over():
+            self.size -= len(self.records.popleft())
+            self.first += 1
+            self.dropped += 1
+        return self.marker - 1
+
+    def _over(self) -> bool:
+        if self.max_records is not None and len(self.records) > self.max_records:
+            return True
+        return self.max_bytes is not None and self.size > self.max_bytes
+
+    def since(self, cursor: int = None):
+        """
+        Records from ``cursor`` on.
+        :param cursor: a ``marker``, ``None`` for every record kept
+        :return: ``(records, marker)``, the marker to continue from
+        """
+        start = 0 if cursor is None else max(cursor - self.first, 0)
+        records = list(islice(self.records, start, None))
+        return records, self.marker
+
+    def text(self, cursor: int = None) -> str:
+        records, _ = self.since(cursor)
+        return ''.join(record.text for record in records)
+
+    def clear(self):
+        """Drop every record, cursors stay valid."""
+        self.first = self.marker
+        self.records.clear()
+        self.size = 0
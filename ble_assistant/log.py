@@ -9,7 +9,11 @@ import ctypes
 import platform
 import sys
 import os
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+import atexit
+import queue
+import threading
+from logging.handlers import (RotatingFileHandler, TimedRotatingFileHandler,
+                              QueueHandler, QueueListener)
 
 from .config import settings
 
@@ -64,7 +68,147 @@ def add_coloring_to_emit_ansi(fn):
     return new
 
 
-def setup_dongle_log(name=None):
+class LazyHex:
+    """Hex text of ``data``, built only when the log record is emitted."""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return self.data.hex()
+
+
+class LazyRepr:
+    """``repr`` of ``data``, built only when the log record is emitted."""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return repr(self.data)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    ``QueueHandler.prepare`` formats every record on the calling thread,
+    this one only does so for records with an exception, whose
+    traceback would not outlive the caller. Log arguments must therefore
+    not change after the call, e.g. bytes rather than a bytearray.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+
+class LogListener(QueueListener):
+    """
+    Queue listener whose handlers can change while it runs.
+    """
+
+    def __init__(self, log_queue, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.handlers = list(handlers)
+        self._lock = threading.Lock()
+
+    def add_handler(self, handler):
+        with self._lock:
+            if handler not in self.handlers:
+                self.handlers = self.handlers + [handler]
+
+    def remove_handler(self, handler):
+        with self._lock:
+            self.handlers = [h for h in self.handlers if h is not handler]
+
+    def handle(self, record):
+        record = self.prepare(record)
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+# logger name -> listener, for the loggers set up with queue=True
+_listeners = {}
+
+
+def get_listener(log):
+    """
+    The listener that emits the records of ``log``, ``None`` if the
+    logger handles them itself.
+    """
+    return _listeners.get(log.name)
+
+
+def install_queue(log):
+    """
+    Move the handlers of ``log`` behind a queue, so they format and
+    write on a background thread.
+    """
+    listener = get_listener(log)
+    if listener is not None:
+        return listener
+    log_queue = queue.SimpleQueue()
+    listener = LogListener(log_queue, *log.handlers)
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.addHandler(DeferredQueueHandler(log_queue))
+    _listeners[log.name] = listener
+    listener.start()
+    return listener
+
+
+def add_handler(log, handler):
+    """
+    Add ``handler`` to ``log``, or to its listener in queue mode.
+    """
+    listener = get_listener(log)
+    if listener is not None:
+        listener.add_handler(handler)
+    else:
+        log.addHandler(handler)
+
+
+def get_handlers(log):
+    listener = get_listener(log)
+    if listener is not None:
+        return list(listener.handlers)
+    return list(log.handlers)
+
+
+def remove_handler(log, handler):
+    listener = get_listener(log)
+    if listener is not None:
+        listener.remove_handler(handler)
+    else:
+        log.removeHandler(handler)
+
+
+def shutdown_logging():
+    """
+    Emit every queued record, then hand the handlers back to their
+    loggers, so anything logged later is written directly.
+    """
+    while _listeners:
+        name, listener = _listeners.popitem()
+        listener.stop()
+        log = logging.getLogger(name)
+        for handler in list(log.handlers):
+            if isinstance(handler, DeferredQueueHandler):
+                log.removeHandler(handler)
+        for handler in listener.handlers:
+            handler.flush()
+            log.addHandler(handler)
+
+
+atexit.register(shutdown_logging)
+
+
+def setup_dongle_log(name=None, queued=None):
     """set dongle log"""
     if name is None:
         name = settings.DONGLE_LOG_NAME
@@ -84,11 +228,13 @@ def setup_dongle_log(name=None):
                                        backupCount=settings.DONGLE_LOG_BACKUP_COUNT)
     handler.setLevel(settings.LOG_LEVEL)
     handler.setFormatter(formatter)
-    log.addHandler(handler)
+    add_handler(log, handler)
+    if settings.LOG_QUEUE if queued is None else queued:
+        install_queue(log)
     return log
 
 
-def setup_serial_log(name=None):
+def setup_serial_log(name=None, queued=None):
     """serial log"""
     if name is None:
         name = settings.SERIAL_LOG_NAME
@@ -108,7 +254,9 @@ def setup_serial_log(name=None):
                                        backupCount=settings.SERIAL_LOG_BACKUP_COUNT)
     handler.setLevel(settings.LOG_LEVEL)
     handler.setFormatter(formatter)
-    log.addHandler(handler)
+    add_handler(log, handler)
+    if settings.LOG_QUEUE if queued is None else queued:
+        install_queue(log)
     return log
 
 
@@ -119,20 +267,20 @@ def set_file_handler(filename, log=None):
     if log is None:
         log = logging.getLogger(settings.LOG_NAME)
     formatter = logging.Formatter(settings.LOG_FORMATTER)
-    for handler in log.handlers:
+    for handler in get_handlers(log):
         if isinstance(handler, logging.FileHandler):
-            log.removeHandler(handler)
+            remove_handler(log, handler)
     # handler = logging.FileHandler(filename)
     handler = RotatingFileHandler(filename=filename,
                                   maxBytes=100*1024*1024,
                                   backupCount=settings.SERIAL_LOG_BACKUP_COUNT)
     handler.setLevel(settings.LOG_LEVEL)
     handler.setFormatter(formatter)
-    log.addHandler(handler)
+    add_handler(log, handler)
     return log
 
 
-def setup_logging(filename=None):
+def setup_logging(filename=None, queued=None):
     """setup logging"""
     if platform.system() == 'Windows':
         logging.StreamHandler.emit = add_coloring_to_windows(logging.StreamHandler.emit)
@@ -150,6 +298,8 @@ def setup_logging(filename=None):
         ch = logging.StreamHandler(stream=sys.stdout)
         ch.setLevel(settings.LOG_LEVEL)
         ch.setFormatter(formatter)
-        log.addHandler(ch)
+        add_handler(log, ch)
 
+    if settings.LOG_QUEUE if queued is None else queued:
+        install_queue(log)
     return log
@@ -0,0 +1,114 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Link metrics of a port: plain counters and fixed-bucket histograms,
+updated on the event loop and read by ``snapshot`` from any thread
+without locking.
+"""
+
+import time
+from bisect import bisect_left
+
+# upper bounds in seconds, the last bucket takes everything above
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01,
+                   0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Histogram:
+    """Counts of values per bucket, plus count, sum and maximum."""
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        labels = [f'<={bound:g}' for bound in self.bounds]
+        labels.append(f'>{self.bounds[-1]:g}')
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'buckets': dict(zip(labels, self.counts))}
+
+
+class LinkMetrics:
+    """
+    Traffic of one port.
+
+    The protocol counts bytes and frames; decoder noise and receive
+    queue depth are read from their owners at snapshot time. ``wait``
+    is the time from a frame's receipt until a test takes it,
+    ``process`` the time spent decoding and dispatching one received
+    chunk.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.rx_frames = 0
+        self.tx_frames = 0
+        # transport writes, fewer than tx_frames when coalescing
+        self.tx_writes = 0
+        self.frames = {}
+        self.wait = Histogram()
+        self.process = Histogram()
+
+    def received(self, data: bytes):
+        self.rx_bytes += len(data)
+
+    def frame(self, header: bytes):
+        self.rx_frames += 1
+        frames = self.frames
+        frames[header] = frames.get(header, 0) + 1
+
+    def sent(self, data: bytes):
+        self.tx_bytes += len(data)
+        self.tx_frames += 1
+
+    def snapshot(self, decoder=None, queue: dict = None) -> dict:
+        uptime = time.monotonic() - self.started
+        res = {
+            'uptime': uptime,
+            'rx_bytes': self.rx_bytes,
+            'tx_bytes': self.tx_bytes,
+            'rx_frames': self.rx_frames,
+            'tx_frames': self.tx_frames,
+            'tx_writes': self.tx_writes,
+            'rx_bytes_s': self.rx_bytes / uptime if uptime else 0.0,
+            'rx_frames_s': self.rx_frames / uptime if uptime else 0.0,
+            'frames': {header.hex(): count
+                       for header, count in list(self.frames.items())},
+            'wait': self.wait.snapshot(),
+            'process': self.process.snapshot(),
+        }
+        if decoder is not None:
+            res['checksum_failures'] = decoder.checksum_failures
+            res['resync_bytes'] = decoder.discarded
+            res['resyncs'] = decoder.resyncs
+        if queue is not None:
+            res['queue_depth'] = queue['depth']
+            res['queue_peak'] = queue['peak_depth']
+            res['queue_dropped'] = queue['dropped']
+        return res
+
+    @staticmethod
+    def rates(previous: dict, current: dict) -> dict:
+        """Bytes and frames per second between two snapshots."""
+        elapsed = current['uptime'] - previous['uptime']
+        if elapsed <= 0:
+            return {}
+        return {key + '_s': (current[key] - previous[key]) / elapsed
+                for key in ('rx_bytes', 'tx_bytes', 'rx_frames', 'tx_frames')}
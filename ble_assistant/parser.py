@@ -3,14 +3,23 @@
 
 All rights reserved.
 """
+import os
+import re
+import struct
+import pickle
+import threading
 import xml.etree.ElementTree as ElementTree
 
-from ble_assistant.blenamedtuple import FrameTuple
-from ble_assistant.utils import check_sum
+from ble_assistant import logger
+from ble_assistant.blenamedtuple import Frame
+from ble_assistant.utils import find_check_sum, sum_to_check_sum
 from ble_assistant.config import settings
 
 LOG_HEADERS = [settings.HEADER_LOG, settings.HEADER_BALI_LOG]
 HEADERS = [settings.HEADER_DOWNLINK] + LOG_HEADERS + settings.HEADER_UPLINK
+# first bytes of the headers, a header when they are one byte long
+HEADER_BYTES = frozenset(header[0] for header in HEADERS)
+HEADER_PATTERN = re.compile(b'|'.join(re.escape(header) for header in HEADERS))
 
 BYTE_ORDER = settings.BYTE_ORDER
 HEADER_SIZE = settings.HEADER_SIZE
@@ -23,9 +32,122 @@ PAYLOAD_INDEX = settings.PAYLOAD_INDEX
 CHECKSUM_SIZE = settings.CHECKSUM_SIZE
 FRAME_MIN_SIZE = settings.FRAME_MIN_SIZE
 
+_INT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+class FrameCodec:
+    """
+    Frame layout compiled from settings.
+
+    A frame is ``protocol | data length | payload | checksum``. The
+    fixed parts are packed and unpacked with precompiled structs, and
+    frames can be written straight into a preallocated buffer.
+    """
+
+    def __init__(self, config):
+        order = '<' if config.BYTE_ORDER == 'little' else '>'
+        self.protocol_size = config.PROTOCOL_SIZE
+        self.payload_index = config.PAYLOAD_INDEX
+        self.checksum_size = config.CHECKSUM_SIZE
+        self.min_size = config.FRAME_MIN_SIZE
+        self.prefix = struct.Struct(
+            f'{order}{config.PROTOCOL_SIZE}s'
+            f'{_INT_FORMATS[config.DATA_LEN_SIZE]}'
+        )
+
+    def frame_size(self, data_len: int) -> int:
+        return self.payload_index + data_len + self.checksum_size
+
+    def unpack_prefix(self, data, offset: int = 0):
+        """
+        :return: protocol bytes and payload length of the frame at
+            ``data[offset]``.
+        """
+        return self.prefix.unpack_from(data, offset)
+
+    def verify(self, data, offset: int, end: int) -> bool:
+        """Check the checksum stored at ``data[end]``."""
+        checksum = data[end: end + self.checksum_size]
+        return checksum == sum_to_check_sum(sum(data[offset:end]),
+                                            self.checksum_size)
+
+    def pack_into(self, buffer, offset: int,
+                  header: bytes, payload: bytes = b'') -> int:
+        """
+        Write a frame into ``buffer`` at ``offset``.
+
+        :return: the frame size.
+        """
+        if len(header) != self.protocol_size:
+            raise ValueError(f'Header must be {self.protocol_size} bytes: '
+                             f'{header.hex()}')
+        data_len = len(payload)
+        self.prefix.pack_into(buffer, offset, header, data_len)
+        start = offset + self.payload_index
+        end = start + data_len
+        buffer[start:end] = payload
+        checksum_end = end + self.checksum_size
+        buffer[end:checksum_end] = sum_to_check_sum(sum(buffer[offset:end]),
+                                                    self.checksum_size)
+        return checksum_end - offset
+
+    def encode(self, header: bytes, payload: bytes = b'') -> bytes:
+        frame = bytearray(self.frame_size(len(payload)))
+        self.pack_into(frame, 0, header, payload)
+        return bytes(frame)
+
+
+codec = FrameCodec(settings)
+
+BALI_LOG_HEADER = settings.HEADER_BALI_LOG
+DONGLE_INFO_HEADER = b'\xbb\x00\x00'
+
+# bytes a FrameDecoder appends to before it moves to a new block
+DECODER_BLOCK_SIZE = 64 * 1024
+
+CACHE_VERSION = 3
+LOG_MEMO_SIZE = 4096
+
+
+class _LogFormatter:
+    """Text rendering of one Bali log code."""
+    __slots__ = ('prefix', 'width', 'paras', 'key', 'desc')
+
+    def __init__(self, prefix, width=None, paras=None, key=None, desc=None):
+        self.prefix = prefix
+        self.width = width
+        # enum texts: the shared table, read at key + value
+        self.paras = paras
+        self.key = key
+        self.desc = desc
+
+    def format(self, log: bytes) -> str:
+        if self.width is None:
+            return f'{self.prefix}[raw_data:{log.hex()}]'
+        value = int.from_bytes(log[5:5 + self.width], 'little')
+        if self.paras is not None:
+            # one flat table for all codes, where key + value of one
+            # code may be the key of another, as it was always read
+            para = self.paras.get(f'{self.key}{value}', '')
+        else:
+            para = self.desc + hex(value)
+        if para:
+            return f'{self.prefix}[{para}][raw_data:{log.hex()}]'
+        return f'{self.prefix}[raw_data:{log.hex()}]'
+
 
 class LogParser:
-    def __init__(self, config_file):
+    """
+    Bali log decoder built from the log description file.
+
+    The tables walked out of the XML are cached in a binary file next
+    to it and reused while the description file is unchanged.
+
+    ``parse_log`` may be called from the loop and from a log listener
+    thread rendering lazy dongle log records at the same time, its
+    formatters and memo are shared under a lock.
+    """
+    def __init__(self, config_file, cache_file=None):
         self.file = config_file
         self.bali_log_type = {}
         self.bali_log_info = {}
@@ -44,6 +166,56 @@ class LogParser:
                                 'RAW_VALUE_TYPE_BITMAP8': 1,
                                 'RAW_VALUE_TYPE_BITMAP16': 2,
                                 'RAW_VALUE_TYPE_BITMAP32': 4}
+        if cache_file is None:
+            cache_file = os.path.splitext(config_file)[0] + '.cache'
+        self.cache_file = cache_file
+        if not self.load_cache():
+            self.parse_file()
+            self.save_cache()
+        # 16 bit log code -> _LogFormatter
+        self.formatters = {}
+        # recent raw log -> text
+        self.memo = {}
+        self._lock = threading.Lock()
+
+    @property
+    def tables(self):
+        return (self.bali_log_type, self.bali_log_info, self.bali_log_para,
+                self.value_type_map)
+
+    def cache_key(self):
+        """The description file is identified by path, size and mtime."""
+        stat = os.stat(self.file)
+        return (CACHE_VERSION, os.path.abspath(self.file),
+                stat.st_size, stat.st_mtime_ns)
+
+    def load_cache(self) -> bool:
+        """Load the compiled tables if the cache is still valid."""
+        try:
+            key = self.cache_key()
+            with open(self.cache_file, 'rb') as f:
+                cache_key, tables = pickle.load(f)
+        except (OSError, EOFError, TypeError, ValueError, pickle.PickleError):
+            return False
+        if cache_key != key:
+            return False
+        (self.bali_log_type, self.bali_log_info, self.bali_log_para,
+         self.value_type_map) = tables
+        return True
+
+    def save_cache(self):
+        tmp = f'{self.cache_file}.{os.getpid()}'
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump((self.cache_key(), self.tables), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def parse_file(self):
+        """Build the tables from the description file."""
         tree = ElementTree.ElementTree(file=self.file)
         for log_type in tree.findall('./auto/log_type'):
             item = log_type.attrib
@@ -67,56 +239,123 @@ class LogParser:
                 else:
                     self.bali_log_para[value_type] = i.get('description')
 
-    def parse_log(self, log):
-        """parse and return log info"""
-        log_type = self.bali_log_type.get(str(log[2] >> 2), '')
-        key = f"{log_type}{int.from_bytes(log[2:4], 'big') & 0x3ff}"
-        log_info = self.bali_log_info.get(key, '')
+    def make_formatter(self, code: int):
+        """Resolve everything known about a log code up front."""
+        log_type = self.bali_log_type.get(str(code >> 10), '')
+        log_info = self.bali_log_info.get(f'{log_type}{code & 0x3ff}', '')
         key = log_type + log_info
+        prefix = ''.join(f'[{item}]' for item in (log_type, log_info) if item)
         value_type = self.value_type_map.get(key)
-        log_para = ''
-        if value_type:
-            desc_len = self.value_type_dict.get(value_type)
-            cursor = desc_len
-            if 'ENUM' in value_type:
-                _ = key + str(int.from_bytes(log[5:5+cursor], 'little'))
-                para = self.bali_log_para.get(_, '')
-                #
-                #
-                #
-                #
-                #
-            else:
-                para = self.bali_log_para.get(key, '') + str(hex(int.from_bytes(log[5:5+cursor], 'little')))
-            log_para = para
-        text = []
-        for item in [log_type, log_info, log_para]:
-            if item:
-                text.append(f'[{item}]')
-        text.append(f'[raw_data:{log.hex()}]')
-        return ''.join(text)
-
-    def parser_raw_data(self, data):
-        header = settings.HEADER_BALI_LOG
-        if data[1] == 0xd8:
-            raw_data = data[:5]
-            data_len = 4
-        elif data[1] == 0xd9:
-            data_len = data[4]
-            raw_data = data[:(4 + data_len + 2)]
-        else:
-            return b''
-        payload = self.parse_log(raw_data)
-        frame = FrameTuple(header=header,
-                           data_len=data_len,
-                           payload=payload,
-                           checksum=b'',
-                           length=len(raw_data),
-                           raw_data=raw_data)
-        return frame
+        if not value_type:
+            return _LogFormatter(prefix)
+        width = self.value_type_dict.get(value_type, 0)
+        if 'ENUM' in value_type:
+            return _LogFormatter(prefix, width,
+                                 paras=self.bali_log_para, key=key)
+        return _LogFormatter(prefix, width,
+                             desc=self.bali_log_para.get(key, ''))
+
+    def parse_log(self, log):
+        """parse and return log info"""
+        log = bytes(log)
+        with self._lock:
+            text = self.memo.get(log)
+            if text is not None:
+                return text
+            code = log[2] << 8 | log[3]
+            formatter = self.formatters.get(code)
+            if formatter is None:
+                formatter = self.formatters[code] = self.make_formatter(code)
+            text = formatter.format(log)
+            if len(self.memo) >= LOG_MEMO_SIZE:
+                del self.memo[next(iter(self.memo))]
+            self.memo[log] = text
+        return text
+
+    def parser_raw_data(self, data, start=0):
+        """
+        Cut the Bali log frame starting at ``data[start]``.
+
+        Return ``None`` if the frame is not complete yet.
+        """
+        return bali_log_frame(data, start, self)
+
+
+def bali_log_frame(data, start=0, log_parser=None, view=None):
+    """
+    Cut the Bali log frame starting at ``data[start]``.
+
+    The payload is the text decoded by ``log_parser``, or the raw log
+    when it is ``None``. The frame refers to ``view``, a memoryview of
+    ``data``, made here when not given.
+
+    :return: the frame, ``None`` if it is not complete yet, or ``b''``
+        if this is not a Bali log.
+    """
+    end = len(data)
+    if end - start < 2:
+        return None
+    if data[start + 1] == 0xd8:
+        length = 5
+        data_len = 4
+    elif data[start + 1] == 0xd9:
+        if end - start < 5:
+            return None
+        data_len = data[start + 4]
+        length = 4 + data_len + 2
+    else:
+        return b''
+    if end - start < length:
+        return None
+    end = start + length
+    if view is None:
+        view = _view(data)
+    decoded = None
+    if log_parser is not None:
+        decoded = log_parser.parse_log(data[start: end])
+    return Frame(view, start, start, end, end, end,
+                 BALI_LOG_HEADER, data_len, decoded)
+
 
+def _view(data) -> memoryview:
+    if isinstance(data, memoryview):
+        return data
+    return memoryview(data)
 
-log_parser = LogParser(settings.BALI_LOG_DESCRIPT)
+
+_log_parser = None
+# why the parser could not be built, it is not tried again
+_log_parser_error = None
+
+
+def get_log_parser():
+    """
+    Build the Bali log parser when the first log needs it.
+
+    :return: the parser, or ``None`` if the description file could not
+        be loaded; that is logged once and Bali logs keep their raw
+        bytes instead of failing the receive path.
+    """
+    global _log_parser, _log_parser_error
+    if _log_parser is None and _log_parser_error is None:
+        try:
+            _log_parser = LogParser(settings.BALI_LOG_DESCRIPT)
+        except Exception as exc:
+            _log_parser_error = exc
+            logger.error('Bali log description %s not loaded, logs stay '
+                         'raw: %r', settings.BALI_LOG_DESCRIPT, exc)
+    return _log_parser
+
+
+def raw_log_text(log) -> str:
+    """Text of a Bali log that cannot be decoded."""
+    return f'[raw_data:{bytes(log).hex()}]'
+
+
+def __getattr__(name):
+    if name == 'log_parser':
+        return get_log_parser()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def is_log_frame(frame):
@@ -128,84 +367,286 @@ def make_frame(header: bytes,
                data: bytes = None) -> bytes:
     if data is None:
         data = b''
-    data_len = len(data)
-    data_len = data_len.to_bytes(DATA_LEN_SIZE,
-                                 BYTE_ORDER)
-    data = header + data_len + data
-    frame = data + check_sum(data,
-                             CHECKSUM_SIZE)
-    return frame
+    return codec.encode(header, data)
 
 
 def is_ble_dongle_info(header: bytes) -> bool:
     if settings.DEVICE != 'ble':
         return False
-    return header == b'\xbb\x00\x00'
-
-
-def ble_dongle_info_parser(data: bytes):
-    st = settings.FRAME_MIN_SIZE - 1
-    for i in range(st, len(data)):
-        checksum = data[i: i + CHECKSUM_SIZE]
-        if checksum == check_sum(data[:i], CHECKSUM_SIZE):
-            protocol = data[: PROTOCOL_SIZE]
-            data_len = len(data) - PROTOCOL_SIZE - CHECKSUM_SIZE
-            payload = data[PROTOCOL_SIZE: -CHECKSUM_SIZE]
-            frame = FrameTuple(header=protocol,
-                               data_len=data_len,
-                               payload=payload,
-                               checksum=checksum,
-                               length=i + 1,
-                               raw_data=data[:i+1])
-            return frame
+    return header == DONGLE_INFO_HEADER
+
+
+def ble_dongle_info_parser(data: bytes, start: int = 0, view=None):
+    """
+    Parse the dongle information frame starting at ``data[start]``.
+
+    Its length field is not reliable, so the frame ends at the first
+    byte matching the checksum of everything before it.
+    """
+    st = start + codec.min_size - 1
+    i = find_check_sum(data, start, st, codec.checksum_size)
+    if i < 0:
+        return None
+    if view is None:
+        view = _view(data)
+    protocol, _ = codec.unpack_prefix(data, start)
+    payload = start + codec.protocol_size
+    return Frame(view, start, payload, i, i + 1, i + codec.checksum_size,
+                 protocol, i - payload)
+
+
+def _frame_at(data, start: int, lazy_log: bool = False, view=None):
+    """
+    Parse the frame starting at ``data[start]``.
+
+    With ``lazy_log`` Bali logs keep their raw bytes as payload.
+
+    :return: the frame, ``None`` if more data is needed to decide,
+        or ``b''`` if no valid frame starts there.
+    """
+    if data[start: start + HEADER_SIZE] == BALI_LOG_HEADER:
+        return bali_log_frame(data, start,
+                              None if lazy_log else get_log_parser(), view)
+    if len(data) - start < codec.min_size:
+        return None
+    protocol, data_len = codec.unpack_prefix(data, start)
+    if protocol == DONGLE_INFO_HEADER and is_ble_dongle_info(protocol):
+        return ble_dongle_info_parser(data, start, view)
+    payload_index = start + codec.payload_index
+    check_sum_index = payload_index + data_len
+    end = check_sum_index + codec.checksum_size
+    if end > len(data):
+        return None
+    if codec.verify(data, start, check_sum_index):
+        if view is None:
+            view = _view(data)
+        return Frame(view, start, payload_index, check_sum_index,
+                     check_sum_index, end, protocol, data_len)
     return b''
 
 
+def _frame_need(data, start: int) -> int:
+    """
+    Size ``data`` must reach before ``_frame_at(data, start)`` can tell
+    more than it did.
+    """
+    size = len(data)
+    if data[start: start + HEADER_SIZE] == BALI_LOG_HEADER:
+        if size - start < 2 or data[start + 1] != 0xd9:
+            return start + 5
+        if size - start < 5:
+            return start + 5
+        return start + 4 + data[start + 4] + 2
+    if size - start < codec.min_size:
+        return start + codec.min_size
+    protocol, data_len = codec.unpack_prefix(data, start)
+    if protocol == DONGLE_INFO_HEADER and is_ble_dongle_info(protocol):
+        # ends wherever a checksum matches, any new byte may do
+        return size + 1
+    return codec.frame_size(data_len) + start
+
+
 def frame_parser(data: bytes):
-    if data[:HEADER_SIZE] == settings.HEADER_BALI_LOG:
-        return log_parser.parser_raw_data(data)
-    if len(data) < settings.FRAME_MIN_SIZE:
-        return b''
-    protocol = data[: PROTOCOL_SIZE]
-    if is_ble_dongle_info(protocol):
-        return ble_dongle_info_parser(data)
-    data_len = int.from_bytes(data[DATA_LEN_INDEX: PAYLOAD_INDEX],
-                              byteorder=BYTE_ORDER)
-    check_sum_index = data_len + PAYLOAD_INDEX
-    if check_sum_index >= len(data):
-        return b''
-    end = check_sum_index + CHECKSUM_SIZE
-    checksum = data[check_sum_index: end]
-    line = data[:check_sum_index]
-    if checksum == check_sum(line, CHECKSUM_SIZE):
-        payload = data[PAYLOAD_INDEX: PAYLOAD_INDEX + data_len]
-        frame = FrameTuple(header=protocol,
-                           data_len=data_len,
-                           payload=payload,
-                           checksum=checksum,
-                           length=len(line),
-                           raw_data=line)
-        return frame
-    return b''
+    return _frame_at(data, 0) or b''
 
 
-def line_parser(data: bytes):
-    cursor = 0
-    end = len(data)
-    res = []
-    remain = data
-    while cursor < end:
-        if cursor + FRAME_MIN_SIZE > end:
-            break
-        if data[cursor: cursor+HEADER_SIZE] in HEADERS:
-            frame = frame_parser(data[cursor:])
-            if frame:
-                cursor = frame.length + cursor
-                remain = data[cursor:]
-                res.append(frame)
+class FrameDecoder:
+    """
+    Incremental frame decoder.
+
+    Complete frames are cut out of the bytes fed in, and a partial
+    frame is kept until the rest of its bytes arrive, without being
+    scanned again on every chunk. Frames come out in the same order as
+    with a full rescan: header positions still waiting for data are
+    retried, once there is enough of it, before new bytes are
+    examined, and the first one that completes wins. While the frame
+    due right after the previous one waits for data, header bytes
+    within it are not tried, so a header-like payload byte cannot cut
+    a frame out of a clean stream however it is chunked.
+
+    Noise between frames is skipped by jumping to the next header
+    byte; ``discarded`` counts the bytes dropped that way and
+    ``resyncs`` the number of times the stream lost frame sync.
+    ``rejected`` counts header bytes that did not start a valid frame,
+    most of them header-like bytes in payloads or noise;
+    ``checksum_failures`` only the frames that failed their checksum
+    where a frame was due, right after the previous one.
+
+    Bytes are appended to a block of ``block_size`` bytes behind a read
+    offset, frames are views of that block. The bytes not consumed yet
+    are only copied to a new block once the block is full, never in
+    place: the frames handed out keep referring to the old one.
+
+    With ``lazy_log`` Bali logs are only cut out, see ``bali_log_frame``.
+    """
+
+    def __init__(self, lazy_log: bool = False,
+                 block_size: int = DECODER_BLOCK_SIZE):
+        self.lazy_log = lazy_log
+        self.block_size = block_size
+        self._block = bytearray()
+        # read offset, first byte that may still start a frame
+        self._start = 0
+        # end of the bytes fed in
+        self._end = 0
+        # first position not examined yet
+        self._scan = 0
+        # header position waiting for more data -> buffer size it needs,
+        # in stream order
+        self._pending = {}
+        # end of the last frame or of the last discarded bytes
+        self._consumed = 0
+        # where the next frame should start, None when out of sync
+        self._due = 0
+        self._synced = True
+        self.discarded = 0
+        self.resyncs = 0
+        self.rejected = 0
+        self.checksum_failures = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def remain(self) -> bytes:
+        """Bytes buffered but not consumed by a frame yet."""
+        return bytes(self._block[self._start:self._end])
+
+    def clear(self):
+        # frames handed out may still refer to the block
+        self._block = bytearray()
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+        self._pending = {}
+        self._consumed = 0
+        self._due = 0
+
+    def feed(self, data: bytes) -> list:
+        """
+        Append ``data`` and return the frames completed by it.
+        """
+        end = self._end + len(data)
+        if end > len(self._block):
+            self._move(len(data))
+            end = self._end + len(data)
+        block = self._block
+        block[self._end:end] = data
+        self._end = end
+        buffer = memoryview(block)[:end].toreadonly()
+        lazy_log = self.lazy_log
+        pending = self._pending
+        last = end - FRAME_MIN_SIZE
+        scan = self._scan
+        frames = []
+        while True:
+            pos = frame = None
+            if pending:
+                pos, frame = self._retry_pending(buffer)
+            # nothing else is tried while the frame due is incomplete
+            while not frame and scan <= last and self._due not in pending:
+                # in sync the next frame starts right here
+                if buffer[scan] not in HEADER_BYTES or (
+                        HEADER_SIZE > 1 and
+                        not HEADER_PATTERN.match(buffer, scan)):
+                    match = HEADER_PATTERN.search(buffer, scan,
+                                                  last + HEADER_SIZE)
+                    if match is None:
+                        scan = last + 1
+                        break
+                    scan = match.start()
+                pos = scan
+                scan += 1
+                frame = _frame_at(buffer, pos, lazy_log, buffer)
+                if frame is None:
+                    pending[pos] = _frame_need(buffer, pos)
+                elif not frame:
+                    self._reject(buffer, pos)
+            if not frame:
+                break
+            frames.append(frame)
+            if pos > self._consumed:
+                self._discard(pos)
+            frame_end = pos + frame.length
+            self._consumed = frame_end
+            self._due = frame_end
+            self._synced = True
+            if pending:
+                self._pending = pending = {
+                    p: need for p, need in pending.items() if p >= frame_end}
+            if frame_end > scan:
+                scan = frame_end
+        self._scan = scan
+        start = next(iter(pending)) if pending else scan
+        if start > self._start:
+            self._discard(start)
+            self._start = start
+        return frames
+
+    def _retry_pending(self, buffer):
+        """First pending position that completes a frame now."""
+        size = len(buffer)
+        for pos, need in list(self._pending.items()):
+            if need > size:
                 continue
-        cursor = cursor + 1
-    return res, remain
+            frame = _frame_at(buffer, pos, self.lazy_log, buffer)
+            if frame:
+                return pos, frame
+            if frame is None:
+                self._pending[pos] = _frame_need(buffer, pos)
+            else:
+                del self._pending[pos]
+                self._reject(buffer, pos)
+        return None, None
+
+    def _reject(self, buffer, pos):
+        self.rejected += 1
+        # Bali logs have no checksum, they are rejected for their type
+        if pos == self._due:
+            self._due = None
+            if buffer[pos: pos + HEADER_SIZE] != BALI_LOG_HEADER:
+                self.checksum_failures += 1
+
+    def _discard(self, end):
+        if end > self._consumed:
+            self.discarded += end - self._consumed
+            if self._synced:
+                self._synced = False
+                self.resyncs += 1
+            self._consumed = end
+
+    def _move(self, size: int):
+        """
+        Move the bytes not consumed to a new block with room for
+        ``size`` more bytes.
+        """
+        keep = self._start
+        tail = self._end - keep
+        block = bytearray(max(self.block_size, 2 * tail + size))
+        block[:tail] = self._block[keep:self._end]
+        self._block = block
+        self._start = 0
+        self._end = tail
+        self._pending = {p - keep: need - keep
+                         for p, need in self._pending.items()}
+        self._scan -= keep
+        self._consumed -= keep
+        if self._due is not None:
+            self._due = self._due - keep if self._due >= keep else None
+
+
+def line_parser(data: bytes):
+    """
+    Parse all complete frames in ``data``.
+
+    Kept for compatibility, stateful callers should feed a
+    ``FrameDecoder`` instead.
+
+    :return: the frames and the bytes left over.
+    """
+    decoder = FrameDecoder(block_size=0)
+    frames = decoder.feed(data)
+    return frames, decoder.remain
 
 
 def custom_value_parser(value):
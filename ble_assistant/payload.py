@@ -6,7 +6,7 @@ All rights reserved.
 """
 from pydantic import validate_arguments
 
-from ble_assistant.parser import make_frame
+from ble_assistant.parser import codec
 from ble_assistant.config import settings
 from ble_assistant.blenamedtuple import ErrorCodeTuple
 
@@ -30,11 +30,9 @@ class BasePayload:
 
     @classmethod
     def downlink(cls, *args, **kwargs):
-        model_id = cls.model_id_just()
-        opcode = cls.opcode_just()
-        header = settings.HEADER_DOWNLINK + model_id + opcode
+        header = cls.get_downlink_header()
         payload = cls.downlink_payload(*args, **kwargs)
-        return make_frame(header, payload)
+        return codec.encode(header, payload or b'')
 
     @staticmethod
     @validate_arguments
@@ -61,3 +59,17 @@ class BasePayload:
         code = int.from_bytes(payload,
                               byteorder=settings.BYTE_ORDER)
         return ErrorCodeTuple(payload.hex(), code)
+
+    @classmethod
+    def simulate(cls, payload: bytes):
+        """
+        Uplink payload a simulated dongle answers the downlink
+        ``payload`` with, ``None`` for no answer.
+        :param payload: downlink payload
+        :return: status code 0 by default
+        """
+        return b'\x00'
+
+    @classmethod
+    def get_downlink_header(cls):
+        return settings.HEADER_DOWNLINK + cls.model_id_just() + cls.opcode_just()
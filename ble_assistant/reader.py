@@ -0,0 +1,214 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Serial transport with a reader thread per port.
+
+The thread does blocking reads of up to ``settings.SERIAL_READ_SIZE``
+bytes and cuts them into frames with its own ``FrameDecoder`` (timed
+in the ``process`` metric of the protocol), so a
+busy event loop cannot make the port overrun. Chunks and frames read
+while the loop is busy are handed over as one batch, with a single
+``call_soon_threadsafe``, to ``raw_received`` and ``frames_received``
+of the protocol.
+
+Dongle logs are cut but not decoded on the thread: their text is only
+rendered when a record is read, so the thread does nothing but read and
+cut frames.
+
+Writes are queued and done by a writer thread per port, so a burst of
+writes never blocks the loop while the serial driver drains. The
+queued bytes are the write buffer of the transport: the protocol is
+paused above ``WRITE_HIGH_WATER`` bytes and resumed below
+``WRITE_LOW_WATER``.
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+
+import serial
+
+from ble_assistant.config import settings
+from ble_assistant.parser import FrameDecoder
+
+# seconds a read waits for data, bounds how long closing takes
+READ_TIMEOUT = 0.05
+# queued write bytes pausing and resuming the protocol
+WRITE_HIGH_WATER = 64 * 1024
+WRITE_LOW_WATER = 16 * 1024
+
+
+class ThreadedSerialTransport(asyncio.Transport):
+    def __init__(self, loop, protocol, serial_instance):
+        super().__init__()
+        self.loop = loop
+        self.protocol = protocol
+        self.serial = serial_instance
+        self.decoder = FrameDecoder(lazy_log=True)
+        self._closing = False
+        self._exc = None
+        self._reading = threading.Event()
+        self._reading.set()
+        self._lock = threading.Lock()
+        self._chunks = []
+        self._frames = []
+        self._scheduled = False
+        self._tx = deque()
+        self._tx_size = 0
+        self._tx_ready = threading.Condition()
+        self._write_paused = False
+        self._thread = threading.Thread(target=self._read_loop,
+                                        name=f'reader-{serial_instance.port}',
+                                        daemon=True)
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name=f'writer-{serial_instance.port}',
+                                        daemon=True)
+
+    def start(self):
+        self.protocol.connection_made(self)
+        self._thread.start()
+        self._writer.start()
+
+    def _read_loop(self):
+        ser = self.serial
+        try:
+            while not self._closing:
+                if not self._reading.wait(READ_TIMEOUT):
+                    continue
+                data = ser.read(1)
+                if not data:
+                    continue
+                waiting = min(ser.in_waiting, settings.SERIAL_READ_SIZE - 1)
+                if waiting:
+                    data += ser.read(waiting)
+                start = time.perf_counter()
+                frames = self.decoder.feed(data)
+                self.protocol.metrics.process.add(time.perf_counter() - start)
+                self._hand_over(data, frames)
+        except (serial.SerialException, OSError, TypeError) as e:
+            # closing the port under a read ends up here as well
+            if not self._closing and ser.is_open:
+                self._exc = e
+        finally:
+            self._closing = True
+            with self._tx_ready:
+                self._tx_ready.notify()
+            # let the writer finish the write in progress
+            self._writer.join(READ_TIMEOUT)
+            if ser.is_open:
+                ser.close()
+            self._call_soon(self._connection_lost, self._exc)
+
+    def _write_loop(self):
+        ser = self.serial
+        while True:
+            with self._tx_ready:
+                while not self._tx and not self._closing:
+                    self._tx_ready.wait()
+                if self._closing:
+                    return
+                data = b''.join(self._tx)
+                self._tx.clear()
+            try:
+                ser.write(data)
+            except (serial.SerialException, OSError, TypeError) as e:
+                if not self._closing:
+                    self._exc = e
+                    self.close()
+                return
+            with self._tx_ready:
+                self._tx_size -= len(data)
+                size = self._tx_size
+            if size <= WRITE_LOW_WATER and self._write_paused:
+                self._call_soon(self._resume_writing)
+
+    def _resume_writing(self):
+        if self._write_paused and self._tx_size <= WRITE_LOW_WATER:
+            self._write_paused = False
+            self.protocol.resume_writing()
+
+    def _call_soon(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # the loop is closed already
+            pass
+
+    def _hand_over(self, data, frames):
+        with self._lock:
+            self._chunks.append(data)
+            self._frames.extend(frames)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._call_soon(self._deliver)
+
+    def _deliver(self):
+        with self._lock:
+            chunks, self._chunks = self._chunks, []
+            frames, self._frames = self._frames, []
+            self._scheduled = False
+        for data in chunks:
+            self.protocol.raw_received(data)
+        self.protocol.frames_received(frames)
+
+    def _connection_lost(self, exc):
+        # frames read before the port closed go first
+        self._deliver()
+        self.protocol.connection_lost(exc)
+
+    def write(self, data):
+        if self._closing:
+            return
+        with self._tx_ready:
+            self._tx.append(bytes(data))
+            self._tx_size += len(data)
+            size = self._tx_size
+            self._tx_ready.notify()
+        if size > WRITE_HIGH_WATER and not self._write_paused:
+            self._write_paused = True
+            self.protocol.pause_writing()
+
+    def pause_reading(self):
+        self._reading.clear()
+
+    def resume_reading(self):
+        self._reading.set()
+
+    def is_reading(self):
+        return self._reading.is_set()
+
+    def get_write_buffer_size(self):
+        return self._tx_size
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        """
+        Stop the threads, the writes still queued are dropped; the
+        reader closes the port and reports the loss.
+        """
+        with self._tx_ready:
+            self._closing = True
+            self._tx_ready.notify()
+
+    def abort(self):
+        self.close()
+
+
+async def create_threaded_serial_connection(loop, protocol_factory,
+                                            *args, **kwargs):
+    """
+    ``serial_asyncio.create_serial_connection`` with a reader thread,
+    arguments go to ``serial.serial_for_url``.
+    """
+    kwargs['timeout'] = READ_TIMEOUT
+    serial_instance = serial.serial_for_url(*args, **kwargs)
+    protocol = protocol_factory()
+    transport = ThreadedSerialTransport(loop, protocol, serial_instance)
+    transport.start()
+    return transport, protocol
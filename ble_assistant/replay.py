@@ -0,0 +1,182 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Replay recorded serial traffic into a protocol, without hardware.
+
+``create_replay_connection`` has the signature of
+``serial_asyncio.create_serial_connection``, with a capture file in
+place of the port, so it can be passed as the ``connector`` of
+``BleComm`` or ``Device``:
+
+    Device(loop, 'logs/serial/capture-....bcap',
+           connector=create_replay_connection, speed=0)
+
+Received chunks are delivered with their original boundaries, at the
+recorded pace scaled by ``speed``, or as fast as possible with
+``speed=0``. With ``follow_writes`` the replay waits at every recorded
+write until the protocol has written as many bytes, so responses follow
+requests however the writes were split or coalesced.
+"""
+
+import time
+import asyncio
+
+from ble_assistant import logger
+from ble_assistant.capture import CaptureReader, is_capture_file, RX, TX
+from ble_assistant.decode import iter_serial_log
+
+
+def load_records(path, port=None):
+    """
+    ``(timestamp, direction, data)`` of one port of a capture or a text
+    serial log; the first port by default.
+    """
+    records = []
+    if is_capture_file(path):
+        with CaptureReader(path) as reader:
+            for record in reader:
+                if port is None:
+                    port = record.port
+                if record.port == port:
+                    records.append((record.timestamp, record.direction,
+                                    bytes(record.data)))
+        return records
+    for timestamp, name, data in iter_serial_log(path):
+        if port is None:
+            port = name
+        if name != port:
+            continue
+        text, _, ms = timestamp.partition(',')
+        seconds = time.mktime(time.strptime(text, '%Y-%m-%d %H:%M:%S'))
+        records.append((seconds + int(ms or 0) / 1000, RX, data))
+    return records
+
+
+class ReplayTransport(asyncio.Transport):
+    """
+    Transport that plays ``(timestamp, direction, data)`` records into
+    a protocol.
+
+    What the protocol writes is kept in ``written``. ``finished`` is
+    resolved once every record has been played; the transport stays
+    open until closed, like a port that went quiet.
+    """
+
+    def __init__(self, loop, protocol, records,
+                 speed: float = 1.0,
+                 follow_writes: bool = False):
+        super().__init__()
+        self.loop = loop
+        self.protocol = protocol
+        self.records = records
+        self.speed = speed
+        self.follow_writes = follow_writes
+        self.written = []
+        self.written_size = 0
+        self.finished = loop.create_future()
+        self.serial = None
+        self._closing = False
+        self._reading = asyncio.Event()
+        self._reading.set()
+        self._write_event = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self.protocol.connection_made(self)
+        self._task = self.loop.create_task(self._play())
+
+    async def _play(self):
+        # replay time = record time - base, in wall seconds / speed
+        start = self.loop.time()
+        base = None
+        expected = 0
+        for timestamp, direction, data in self.records:
+            if base is None:
+                base = timestamp
+            if direction == TX:
+                expected += len(data)
+                if self.follow_writes:
+                    while self.written_size < expected:
+                        self._write_event.clear()
+                        await self._write_event.wait()
+                    start, base = self.loop.time(), timestamp
+                continue
+            if direction != RX:
+                continue
+            if self.speed:
+                delay = start + (timestamp - base) / self.speed - self.loop.time()
+                await asyncio.sleep(max(delay, 0.0))
+            else:
+                await asyncio.sleep(0)
+            if not self._reading.is_set():
+                paused = self.loop.time()
+                await self._reading.wait()
+                start += self.loop.time() - paused
+            self.protocol.data_received(data)
+        if not self.finished.done():
+            self.finished.set_result(len(self.records))
+
+    def write(self, data):
+        if self._closing:
+            return
+        self.written.append(bytes(data))
+        self.written_size += len(data)
+        self._write_event.set()
+
+    def pause_reading(self):
+        self._reading.clear()
+
+    def resume_reading(self):
+        self._reading.set()
+
+    def is_reading(self):
+        return self._reading.is_set()
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        if self._task is not None:
+            self._task.cancel()
+        if not self.finished.done():
+            self.finished.cancel()
+        self.loop.call_soon(self.protocol.connection_lost, None)
+
+    def abort(self):
+        self.close()
+
+
+async def create_replay_connection(loop, protocol_factory, source,
+                                   *args, port=None, speed: float = 1.0,
+                                   follow_writes: bool = False, **kwargs):
+    """
+    Replay ``source`` into a new protocol.
+
+    :param source: capture file, text serial log, or a list of
+        ``(timestamp, direction, data)`` records
+    :param port: port to replay from the file, the first by default
+    :param speed: 1 for the recorded pace, N for N times faster,
+        0 for as fast as possible
+    :param follow_writes: hold the replay at recorded writes until the
+        protocol writes
+    :return: ``(transport, protocol)``; serial arguments are ignored
+    """
+    if isinstance(source, (list, tuple)):
+        records = source
+    else:
+        records = load_records(source, port)
+        logger.info('[%s]replay %d records at speed %s', source,
+                    len(records), speed)
+    protocol = protocol_factory()
+    transport = ReplayTransport(loop, protocol, records,
+                                speed=speed, follow_writes=follow_writes)
+    transport.start()
+    return transport, protocol
@@ -124,6 +124,20 @@ class ExcelHandler(Handler):
         self.ws.append(data)
         self.save()
 
+    def write_sheet(self, title: str, rows: list):
+        """
+        Write rows to a worksheet of their own, apart from the report rows.
+        :param title: worksheet title
+        :param rows: lists of cell values, the first one the headers
+        :return:
+        """
+        if self.wb is None:
+            self.create_worksheet()
+        ws = self.wb.create_sheet(title)
+        for row in rows:
+            ws.append(row)
+        self.save()
+
     def save(self):
         """
         Save file.
@@ -0,0 +1,239 @@
+"""
+@author: qiudeliang
+
+All rights reserved.
+
+Software dongle on a pseudo-terminal, Linux only.
+
+The simulator answers every downlink (``0xaa``) frame of a registered
+payload class with its uplink frame, the payload coming from
+``BasePayload.simulate``. Scan reports (``0xdd``), text logs (``0xff``)
+and Bali logs (``0xc7``) can be sent in the background at a target
+rate. The pty name works as a serial port:
+
+    with DongleSimulator(payloads, scan_rate=500) as sim:
+        await app.get_dongles([sim.port])
+
+    python -m ble_assistant.simulator -n 4 --scan-rate 1000
+"""
+
+import os
+import tty
+import time
+import random
+import select
+import inspect
+import argparse
+import threading
+
+from ble_assistant.config import settings
+from ble_assistant.parser import FrameDecoder, codec
+from ble_assistant.payload import BasePayload
+from ble_assistant.utils import load_modules
+
+SCAN_HEADER = b'\xdd\x01\x02'
+LOG_HEADER = settings.HEADER_LOG + b'\x00\x00'
+# seconds between writes of background traffic
+TRAFFIC_TICK = 0.01
+
+
+def load_payloads(pkg=None):
+    """Payload classes with a name, as ``Device`` registers them."""
+    if pkg is None:
+        pkg = f'ble_assistant.payload.{settings.DEVICE}'
+    payloads = []
+    for module in load_modules(pkg):
+        for _, obj in inspect.getmembers(module, inspect.isclass):
+            if issubclass(obj, BasePayload) and getattr(obj, 'name', None):
+                payloads.append(obj)
+    return payloads
+
+
+def scan_frame(rand):
+    # address, address type, rssi and an advertising payload
+    payload = bytes(rand.randrange(256) for _ in range(rand.randrange(36, 41)))
+    return codec.encode(SCAN_HEADER, payload)
+
+
+def log_frame(rand):
+    text = f'tick {rand.randrange(100000)} heap {rand.randrange(4096)}\r\n'
+    return codec.encode(LOG_HEADER, text.encode())
+
+
+def bali_frame(rand):
+    return bytes([0xc7, 0xd8, rand.randrange(256), rand.randrange(256), 0])
+
+
+class DongleSimulator:
+    """
+    One simulated dongle: a pty, a thread answering requests and a
+    thread sending background traffic.
+    """
+
+    def __init__(self, payloads=None, *,
+                 scan_rate: float = 0.0,
+                 log_rate: float = 0.0,
+                 bali_rate: float = 0.0,
+                 seed: int = None):
+        """
+        :param payloads: payload classes to answer, those of
+            ``settings.DEVICE`` by default
+        :param scan_rate: scan reports per second
+        :param log_rate: text logs per second
+        :param bali_rate: Bali logs per second
+        """
+        if payloads is None:
+            payloads = load_payloads()
+        self.responses = {}
+        for payload in payloads:
+            self.responses.setdefault(payload.get_downlink_header(), payload)
+        self.traffic = [(scan_frame, scan_rate),
+                        (log_frame, log_rate),
+                        (bali_frame, bali_rate)]
+        self.rand = random.Random(seed)
+        self.port = None
+        self.stats = {'requests': 0, 'unknown': 0,
+                      'frames': 0, 'bytes': 0}
+        self._master = None
+        self._slave = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self) -> str:
+        """Open the pty and start answering; return the port name."""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        # a blocking write of a large chunk would not see stop()
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._stopped.clear()
+        self._threads = [threading.Thread(target=self._serve,
+                                          name=f'sim-{self.port}',
+                                          daemon=True)]
+        if any(rate for _, rate in self.traffic):
+            self._threads.append(threading.Thread(target=self._send_traffic,
+                                                  name=f'sim-traffic-{self.port}',
+                                                  daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self.port
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def write(self, data: bytes, frames: int = 0):
+        """Send ``data`` to the host, waiting while the pty is full."""
+        view = memoryview(data)
+        with self._lock:
+            self.stats['frames'] += frames
+            while view and not self._stopped.is_set():
+                _, writable, _ = select.select([], [self._master], [], 0.1)
+                if writable:
+                    try:
+                        view = view[os.write(self._master, view):]
+                    except BlockingIOError:
+                        pass
+            self.stats['bytes'] += len(data) - len(view)
+
+    def _serve(self):
+        decoder = FrameDecoder()
+        while not self._stopped.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                continue
+            for frame in decoder.feed(data):
+                if frame.header[:1] == settings.HEADER_DOWNLINK:
+                    self.respond(frame)
+
+    def respond(self, frame):
+        """Answer a downlink frame with the uplink frames of its payload class."""
+        self.stats['requests'] += 1
+        item = self.responses.get(frame.header)
+        if item is None:
+            self.stats['unknown'] += 1
+            return
+        payload = item.simulate(bytes(frame.payload))
+        if payload is None:
+            return
+        headers = item.get_uplink_header()
+        if not isinstance(headers, list):
+            headers = [headers]
+        frames = [codec.encode(header, b'') for header in headers[:-1]]
+        frames.append(codec.encode(headers[-1], payload))
+        self.write(b''.join(frames), len(frames))
+
+    def _send_traffic(self):
+        credits = [0.0] * len(self.traffic)
+        last = time.monotonic()
+        while not self._stopped.wait(TRAFFIC_TICK):
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            frames = []
+            for i, (make, rate) in enumerate(self.traffic):
+                credits[i] += rate * elapsed
+                count = int(credits[i])
+                credits[i] -= count
+                frames.extend(make(self.rand) for _ in range(count))
+            if frames:
+                self.write(b''.join(frames), len(frames))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m ble_assistant.simulator',
+        description='Simulate dongles on pseudo-terminals.',
+    )
+    arg_parser.add_argument('-n', '--number', type=int, default=1,
+                            help='number of dongles')
+    arg_parser.add_argument('--scan-rate', type=float, default=0.0,
+                            help='scan reports per second per dongle')
+    arg_parser.add_argument('--log-rate', type=float, default=0.0,
+                            help='text logs per second per dongle')
+    arg_parser.add_argument('--bali-rate', type=float, default=0.0,
+                            help='Bali logs per second per dongle')
+    arg_parser.add_argument('--duration', type=float, default=None,
+                            help='seconds to run, until interrupted by default')
+    args = arg_parser.parse_args(argv)
+    payloads = load_payloads()
+    simulators = [DongleSimulator(payloads,
+                                  scan_rate=args.scan_rate,
+                                  log_rate=args.log_rate,
+                                  bali_rate=args.bali_rate,
+                                  seed=i)
+                  for i in range(args.number)]
+    for simulator in simulators:
+        print(simulator.start())
+    end = None if args.duration is None else time.monotonic() + args.duration
+    try:
+        while end is None or time.monotonic() < end:
+            time.sleep(1)
+            for simulator in simulators:
+                print(simulator.port, simulator.stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,11 +9,35 @@ import pkgutil
 import importlib
 
 
-def check_sum(data: bytes, length: int = 1) ->bytes:
-    res = (0x100 - sum(data) % 256) % 256
+def sum_to_check_sum(total: int, length: int = 1) -> bytes:
+    """Checksum of data whose byte sum is ``total``."""
+    res = (0x100 - total % 256) % 256
     return res.to_bytes(length, 'little')
 
 
+def check_sum(data: bytes, length: int = 1) ->bytes:
+    return sum_to_check_sum(sum(data), length)
+
+
+def find_check_sum(data: bytes, base: int, start: int,
+                   length: int = 1) -> int:
+    """
+    Find the first index ``i >= start`` where ``data[i:i+length]`` is
+    the checksum of ``data[base:i]``.
+
+    The sum is carried along the scan instead of being recomputed for
+    every candidate, so the search is linear in the buffer size.
+
+    :return: the index, or -1 if there is none.
+    """
+    total = sum(data[base:start])
+    for i in range(start, len(data) - length + 1):
+        if data[i: i + length] == sum_to_check_sum(total, length):
+            return i
+        total += data[i]
+    return -1
+
+
 def import_module(name):
     module = importlib.import_module(name)
     if name in sys.modules:
@@ -11,6 +11,7 @@ import wx
 from wx.lib import newevent
 
 from ble_assistant.config import settings
+from ble_assistant.log import add_handler
 from .utils import ID_COPY_ITEM
 
 
@@ -103,7 +104,7 @@ class LogCtrl(wx.TextCtrl):
         for name in logger_name:
             logger = logging.getLogger(name)
             handler = WxLogHandler(self, wx_log_event)
-            logger.addHandler(handler)
+            add_handler(logger, handler)
         self.Bind(EVT_WX_LOG_EVENT, self.on_log_event)
         self.Bind(wx.EVT_RIGHT_DOWN, self.on_right_down)
 
@@ -477,15 +477,18 @@ class MainFrame(wx.Frame):
 
     def menu_get_dongles(self, event):
         event.Skip()
-        wxasync.StartCoroutine(self.get_dongles(), self)
+        wxasync.StartCoroutine(self.get_dongles(rescan=True), self)
 
-    async def get_dongles(self, event=None):
+    async def get_dongles(self, event=None, rescan=None):
         self.refresh.Enable(False)
         self.status_bar.SetStatusText('Get dongles...', 0)
         self.display.SetLabel('')
         if event is not None:
             event.Skip()
-        await self.app.get_dongles()
+        # probe every port when asked to from the UI
+        if rescan is None:
+            rescan = event is not None
+        await self.app.get_dongles(rescan=rescan)
         ports = self.app.get_ports()
         default_port = self.dongle_port.GetValue()
         self.dongle_port.Clear()